@@ -0,0 +1,154 @@
+# batch.py - Renders many recaps in one process, sharing caches and loaded assets between them.
+#
+# A batch file lists jobs, each of which names an options file and the options to change for that recap, such as its
+# spreadsheet, worksheet and output file. The jobs are run by a pool of worker threads in a single process, so chorus
+# detection results, audio levels, subtitle text, proxies and decoded images are shared between them through the
+# in-memory caches as well as the on-disk ones, and a video used by several recaps at once is only analysed once. A job
+# that fails is recorded and the others carry on. The status and timing of every job is saved to a JSON summary as each
+# job finishes, and printed as a table at the end.
+
+import json
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from recap_generator import fschema, generate_recap, load_yaml, output_description, read_yaml
+
+SUMMARY_VERSION = 1
+
+# Keys of a job that are not options.
+JOB_KEYS = ('name', 'options')
+
+
+def load_jobs(batch):
+    # Turn the jobs of a batch into {'name', 'options_file', 'options'} dicts, with the options validated and their
+    # defaults filled in. Jobs whose options are invalid get an 'error' instead of 'options'.
+    option_names = set(load_yaml(fschema)['properties'])
+    base_options = {}
+    jobs = []
+    written_files = {}
+    for n, spec in enumerate(batch.get('jobs') or [], start=1):
+        # A job may be given as just the path of its options file.
+        spec = spec if isinstance(spec, dict) else {'options': spec}
+        job = {'name': str(spec.get('name', f'job {n}')), 'options_file': spec.get('options', batch.get('options', 'options.yaml'))}
+        jobs.append(job)
+        try:
+            unknown = sorted(set(spec) - option_names - set(JOB_KEYS))
+            if unknown:
+                raise ValueError(f"Unknown options: {', '.join(unknown)}")
+            # Each options file is only read once, however many jobs use it.
+            if job['options_file'] not in base_options:
+                if not os.path.isfile(job['options_file']):
+                    raise FileNotFoundError(f"Options file {job['options_file']} not found")
+                base_options[job['options_file']] = load_yaml(job['options_file']) or {}
+            options = read_yaml({**base_options[job['options_file']], **{key: value for key, value in spec.items() if key not in JOB_KEYS}})
+        except Exception as e:
+            job['error'] = f'{type(e).__name__}: {e}'
+            continue
+
+        # Jobs run at the same time, so two of them writing the same file would overwrite each other's output.
+        # The same goes for profiling reports, which would also be read back for the wrong job.
+        written = [path for path in (output_description(options), options['profile_report']) if path]
+        clashes = [path for path in written if os.path.realpath(path) in written_files]
+        if clashes:
+            job['error'] = '; '.join(f'{path} is also written by {written_files[os.path.realpath(path)]}' for path in clashes)
+            continue
+        written_files.update({os.path.realpath(path): job['name'] for path in written})
+        job['options'] = options
+    return jobs
+
+def run_job(job):
+    # Render one recap, returning its status and timings. Errors are recorded rather than raised.
+    result = {'name': job['name'],
+              'status': 'failed',
+              'options_file': job['options_file'],
+              'video_data_file': None,
+              'worksheet': None,
+              'output_file': None,
+              'started': datetime.now(timezone.utc).isoformat(),
+              'wall_s': 0,
+              'stages': None,
+              'error': job.get('error')}
+    if 'options' not in job:
+        return result
+
+    options = job['options']
+    result.update(video_data_file=options['video_data_file'], worksheet=options['worksheet'] or None, output_file=output_description(options))
+    start = time.perf_counter()
+    try:
+        generate_recap(**options, interactive=False)
+        result['status'] = 'ok'
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+        result['traceback'] = traceback.format_exc()
+        print(f"Recap '{job['name']}' failed: {result['error']}")
+    result['wall_s'] = time.perf_counter() - start
+
+    if options['profile_report'] and result['status'] == 'ok':
+        # Stages that run once per clip are added up.
+        report = json.loads(Path(options['profile_report']).read_text(encoding='utf-8'))
+        result['stages'] = {}
+        for stage in report['stages']:
+            result['stages'][stage['name']] = result['stages'].get(stage['name'], 0) + stage['wall_s']
+    return result
+
+def run_batch(batch_file, workers=None):
+    # Run every job of a batch file, saving the summary as each job finishes. Returns the summary.
+    # workers overrides the number of recaps rendered at once given in the batch file. 0 means one per CPU core.
+    batch = load_yaml(batch_file)
+    if not isinstance(batch, dict) or not batch.get('jobs'):
+        raise ValueError(f'{batch_file} lists no jobs.')
+    workers = (batch.get('workers', 1) if workers is None else workers) or os.cpu_count() or 1
+    summary_file = batch.get('summary_file', f'{Path(batch_file).with_suffix("")}.summary.json')
+    jobs = load_jobs(batch)
+
+    summary = {'version': SUMMARY_VERSION,
+               'batch_file': str(batch_file),
+               'started': datetime.now(timezone.utc).isoformat(),
+               'workers': workers,
+               'wall_s': 0,
+               'jobs': [{'name': job['name'], 'status': 'pending'} for job in jobs]}
+    lock = threading.Lock()
+    start = time.perf_counter()
+
+    def run(n):
+        with lock:
+            summary['jobs'][n]['status'] = 'running'
+        result = run_job(jobs[n])
+        with lock:
+            summary['jobs'][n] = result
+            summary['wall_s'] = time.perf_counter() - start
+            write_summary(summary, summary_file)
+        print(f"Recap {n + 1} of {len(jobs)} ('{jobs[n]['name']}'): {result['status']} in {result['wall_s']:.1f}s")
+
+    print(f'Rendering {len(jobs)} recaps using {min(workers, len(jobs))} workers...')
+    with ThreadPoolExecutor(max_workers=min(workers, len(jobs)), thread_name_prefix='batch') as executor:
+        list(executor.map(run, range(len(jobs))))
+
+    summary['wall_s'] = time.perf_counter() - start
+    write_summary(summary, summary_file)
+    print_summary(summary)
+    print(f'Batch summary saved to {summary_file}')
+    return summary
+
+def write_summary(summary, summary_file):
+    # Write to a temporary file first so that the summary is never left half written.
+    summary_file = Path(summary_file)
+    summary_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = summary_file.with_name(f'{summary_file.name}.tmp')
+    tmp_file.write_text(json.dumps(summary, indent=2) + '\n', encoding='utf-8')
+    os.replace(tmp_file, summary_file)
+
+def print_summary(summary):
+    print()
+    print(f"{'#':>4}  {'Job':<24}  {'Status':<7}  {'Time (s)':>8}  Output")
+    for n, job in enumerate(summary['jobs'], start=1):
+        print(f"{n:>4}  {job['name'][:24]:<24}  {job['status']:<7}  {job.get('wall_s', 0):>8.1f}  {job.get('output_file') or '-'}")
+        if job.get('error'):
+            print(f"{'':>6}{job['error']}")
+    failed = sum(job['status'] != 'ok' for job in summary['jobs'])
+    print(f"\n{len(summary['jobs']) - failed} of {len(summary['jobs'])} recaps rendered in {summary['wall_s']:.1f}s."
+          + (f' {failed} failed.' if failed else ''))
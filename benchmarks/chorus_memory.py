@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# chorus_memory.py - Compares the peak memory use and runtime of the pychorus and streaming chorus detectors.
+#
+# Synthetic audio of increasing length is generated with a chorus planted at known times, and each detector is run on
+# it in a separate process so that its peak resident set size can be measured. The results are printed as a Markdown
+# table. Requires NumPy, FFmpeg and (for the pychorus rows) pychorus. Peak memory is measured with os.wait4, so this
+# script only runs on Linux and macOS.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from media import chorus_times_for, write_synthetic_song
+
+
+def run_detector(detector, input_file, clip_length, memory_budget_mb):
+    # Run one detector in a child process and return its result, runtime and peak RSS in MB.
+    cmd = [sys.executable, __file__, '--run', detector, str(input_file), str(clip_length), str(memory_budget_mb)]
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    output = proc.stdout.read()
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    elapsed = time.perf_counter() - start
+
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS.
+    peak_mb = rusage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    if proc.returncode != 0:
+        return {'detector': detector, 'chorus_start': None, 'seconds': elapsed, 'peak_rss_mb': peak_mb, 'error': f'exit code {proc.returncode}'}
+    # pychorus prints its own message before the result, so only the last line is read.
+    return {'detector': detector, 'chorus_start': json.loads(output.splitlines()[-1])['chorus_start'], 'seconds': elapsed, 'peak_rss_mb': peak_mb, 'error': None}
+
+def detect(detector, input_file, clip_length, memory_budget_mb):
+    if detector == 'streaming':
+        import chorus_detector
+        return chorus_detector.find_chorus(input_file, clip_length, memory_budget_mb)
+    from pychorus import find_and_output_chorus
+    return find_and_output_chorus(input_file, None)
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the memory use and runtime of the chorus detectors on synthetic audio.')
+    parser.add_argument('--minutes', type=float, nargs='+', default=[3, 10, 30, 60], help='Lengths of the synthetic test audio in minutes.')
+    parser.add_argument('--detectors', nargs='+', default=['pychorus', 'streaming'], choices=['pychorus', 'streaming'])
+    parser.add_argument('--clip-length', type=float, default=15)
+    parser.add_argument('--memory-budget-mb', type=float, default=256)
+    parser.add_argument('--output', help='Also write the table to this file.')
+    parser.add_argument('--run', nargs=4, metavar=('DETECTOR', 'FILE', 'CLIP_LENGTH', 'BUDGET'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        detector, input_file, clip_length, memory_budget_mb = args.run
+        chorus_start = detect(detector, input_file, float(clip_length), float(memory_budget_mb))
+        print(json.dumps({'chorus_start': None if chorus_start is None else float(chorus_start)}))
+        return
+
+    rows = ['| Audio length | Detector | Runtime (s) | Peak RSS (MB) | Detected start (s) | Planted starts (s) |',
+            '|---|---|---|---|---|---|']
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for minutes in args.minutes:
+            duration = minutes * 60
+            chorus_times = chorus_times_for(duration)
+            input_file = Path(tmp_dir, f'synthetic_{minutes:g}min.wav')
+            write_synthetic_song(input_file, duration, chorus_times)
+            for detector in args.detectors:
+                result = run_detector(detector, input_file, args.clip_length, args.memory_budget_mb)
+                detected = result['error'] or ('none' if result['chorus_start'] is None else f"{result['chorus_start']:.1f}")
+                rows.append(f"| {minutes:g} min | {detector} | {result['seconds']:.1f} | {result['peak_rss_mb']:.0f} | {detected} | {', '.join(map(str, chorus_times))} |")
+                print(rows[-1], file=sys.stderr)
+            input_file.unlink()
+
+    table = '\n'.join(rows)
+    print(table)
+    if args.output:
+        Path(args.output).write_text(table + '\n', encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# media.py - Synthetic test media for the benchmarks: songs with planted choruses, videos and video data spreadsheets.
+#
+# Everything is generated locally with NumPy, FFmpeg's test sources and openpyxl, so the benchmarks need no network
+# access or real footage. The same seed always produces the same media.
+
+import os
+import subprocess
+import wave
+from pathlib import Path
+
+import numpy as np
+
+FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+
+SAMPLE_RATE = 22050
+NOTE_LENGTH = 0.5
+CHORUS_LENGTH = 20
+
+# Frame sizes of the synthetic videos. Portrait, 4:3 and 16:9 videos are fitted to the height of the 1920x1080 canvas,
+# while ultrawide videos are fitted to its width, so together they cover every branch of resize_clips.
+ASPECT_RATIOS = {'portrait': (360, 640), '4:3': (640, 480), '16:9': (640, 360), 'ultrawide': (860, 360)}
+
+# Sizes of the synthetic intro images: one taller and one wider than the canvas, for both intro overlay branches.
+INTRO_IMAGE_SIZES = {'tall': (600, 800), 'wide': (1600, 600)}
+
+SPREADSHEET_HEADER = ['FILENAME', 'CLIP START', 'CLIP END', 'SUBTITLE 1', 'SUBTITLE 2', 'SUBTITLE 3']
+
+
+def synthesize_notes(pitches, sample_rate=SAMPLE_RATE, note_length=NOTE_LENGTH):
+    # Render a sequence of MIDI pitches as harmonic tones with a short attack and release.
+    n = int(sample_rate * note_length)
+    t = np.arange(n) / sample_rate
+    envelope = np.minimum(1, np.minimum(t / 0.02, (note_length - t) / 0.05))
+    notes = []
+    for pitch in pitches:
+        freq = 440.0 * 2 ** ((pitch - 69) / 12)
+        tone = sum(np.sin(2 * np.pi * freq * k * t) / k for k in range(1, 4))
+        notes.append(0.2 * envelope * tone)
+    return np.concatenate(notes).astype(np.float32)
+
+def write_synthetic_song(path, duration, chorus_times, seed=0):
+    # Write a mono WAV file of random, non-repeating melody with the same chorus melody planted at each chorus time.
+    rng = np.random.default_rng(seed)
+    chorus = synthesize_notes(np.random.default_rng(seed + 1).integers(48, 84, int(CHORUS_LENGTH / NOTE_LENGTH)))
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        t = 0.0
+        for chorus_time in sorted(chorus_times) + [duration]:
+            while t < chorus_time:
+                section = min(CHORUS_LENGTH, chorus_time - t)
+                f.writeframes(to_pcm(synthesize_notes(rng.integers(36, 96, max(1, int(section / NOTE_LENGTH))))))
+                t += max(1, int(section / NOTE_LENGTH)) * NOTE_LENGTH
+            if chorus_time < duration:
+                f.writeframes(to_pcm(chorus))
+                t += CHORUS_LENGTH
+
+def to_pcm(samples):
+    return (np.clip(samples, -1, 1) * 32767).astype('<i2').tobytes()
+
+def chorus_times_for(duration):
+    # Where the chorus is planted in a song of the given length: 30% and 70% of the way through.
+    return [round(duration * 0.3), round(duration * 0.7)]
+
+def write_synthetic_video(path, duration, size, fps=25, seed=0):
+    # Write an H.264/AAC video of FFmpeg's moving test pattern with a synthetic song as its audio.
+    # Returns the planted chorus times.
+    path = Path(path)
+    chorus_times = chorus_times_for(duration)
+    song_file = path.with_suffix('.wav')
+    write_synthetic_song(song_file, duration, chorus_times, seed)
+    try:
+        cmd = [FFMPEG_BINARY, '-nostdin', '-y', '-v', 'error',
+               '-f', 'lavfi', '-i', f'testsrc2=size={size[0]}x{size[1]}:rate={fps}:duration={duration}',
+               '-i', str(song_file), '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p',
+               '-c:a', 'aac', '-shortest', str(path)]
+        subprocess.run(cmd, check=True)
+    finally:
+        song_file.unlink(missing_ok=True)
+    return chorus_times
+
+def write_intro_image(path, size):
+    # Write a PNG test card of the given size.
+    cmd = [FFMPEG_BINARY, '-nostdin', '-y', '-v', 'error', '-f', 'lavfi', '-i', f'testsrc=size={size[0]}x{size[1]}',
+           '-frames:v', '1', str(path)]
+    subprocess.run(cmd, check=True)
+
+def write_video_library(video_dir, n_videos, duration, fps=25):
+    # Write n_videos synthetic videos to video_dir, cycling through the aspect ratios, and return their file names.
+    # Videos that already exist are reused, as generating them takes a while.
+    Path(video_dir).mkdir(parents=True, exist_ok=True)
+    names = []
+    for i in range(n_videos):
+        aspect = list(ASPECT_RATIOS)[i % len(ASPECT_RATIOS)]
+        name = f'synthetic_{i:03d}_{aspect.replace(":", "x")}_{duration:g}s.mp4'
+        if not Path(video_dir, name).exists():
+            write_synthetic_video(Path(video_dir, name), duration, ASPECT_RATIOS[aspect], fps, seed=i)
+        names.append(name)
+    return names
+
+def write_video_data(path, video_names, n_rows, clip_length, duration, manual_every=2):
+    # Write a video data spreadsheet of n_rows rows, cycling through the videos. Every manual_every-th row has a
+    # manually specified clip, and the others are left for chorus detection. Each row has one to three subtitle lines.
+    import openpyxl
+
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(SPREADSHEET_HEADER)
+    for row in range(n_rows):
+        start, end = '', ''
+        if manual_every and row % manual_every == 0:
+            clip_start = int(duration * 0.1)
+            start, end = format_time(clip_start), format_time(clip_start + clip_length)
+        subtitles = [f'Clip {row + 1}', f'Synthetic video {row % len(video_names) + 1}', f'{n_rows} rows'][:row % 3 + 1]
+        ws.append([video_names[row % len(video_names)], start, end] + subtitles)
+    wb.save(path)
+
+def format_time(seconds):
+    # Format a time in seconds as HH:MM:SS, as in the example spreadsheet.
+    return f'{int(seconds) // 3600:02d}:{int(seconds) % 3600 // 60:02d}:{int(seconds) % 60:02d}'
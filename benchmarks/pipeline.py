@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# pipeline.py - Measures the throughput and memory use of each stage of the recap generator on synthetic media.
+#
+# A library of synthetic videos in a mix of aspect ratios is generated with FFmpeg's test sources, along with video data
+# spreadsheets of 5 to 200 rows that mix manually chosen clips with clips left for chorus detection. For each
+# spreadsheet, generate_recap is run in a separate process with profiling enabled, and the stage timings, output frames
+# per second, seconds per clip and peak memory are printed as Markdown tables. The results are saved as JSON so that a
+# later run can be compared against them with --compare. Peak memory of the whole run is measured with os.wait4, so
+# this script only runs on Linux and macOS.
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from media import INTRO_IMAGE_SIZES, write_intro_image, write_video_data, write_video_library
+
+RESULTS_VERSION = 1
+
+# The headline metrics compared by --compare, and whether a higher value is better.
+METRICS = {'total_s': False, 'seconds_per_clip': False, 'output_fps': True, 'peak_rss_mb': False}
+
+
+def run_generator(options):
+    # Run generate_recap in a child process and return its profiling report, wall time and peak RSS in MB.
+    cmd = [sys.executable, __file__, '--run', json.dumps(options)]
+    start = time.perf_counter()
+    # The generator's progress output goes to stderr so that stdout only holds the results tables.
+    proc = subprocess.Popen(cmd, stdout=sys.stderr, stdin=subprocess.DEVNULL)
+    _, status, rusage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - start
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError(f'generate_recap failed with exit code {os.waitstatus_to_exitcode(status)}')
+
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS.
+    peak_mb = rusage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    report = json.loads(Path(options['profile_report']).read_text(encoding='utf-8'))
+    return report, elapsed, peak_mb
+
+def summarise(rows, report, elapsed, peak_mb):
+    # Reduce a profiling report to the benchmark metrics. Stages that run once per clip are added up.
+    stages = {}
+    for stage in report['stages']:
+        summary = stages.setdefault(stage['name'], {'count': 0, 'wall_s': 0, 'cpu_s': 0, 'peak_rss_mb': None})
+        summary['count'] += 1
+        summary['wall_s'] += stage['wall_s']
+        summary['cpu_s'] += stage['cpu_s'] + (stage['child_cpu_s'] or 0)
+        if stage['peak_rss_mb'] is not None:
+            summary['peak_rss_mb'] = max(summary['peak_rss_mb'] or 0, stage['peak_rss_mb'])
+
+    output_frames = round(report['duration_s'] * report['fps'])
+    return {'rows': rows,
+            'render_mode': report['render_mode'],
+            'output_frames': output_frames,
+            'total_s': elapsed,
+            'seconds_per_clip': elapsed / rows,
+            'output_fps': output_frames / stages['write']['wall_s'] if stages.get('write') else None,
+            'peak_rss_mb': peak_mb,
+            'stages': stages,
+            'frames': report['frames']}
+
+def print_tables(results):
+    print('| Rows | Render mode | Total (s) | Seconds per clip | Output frames/s | Peak RSS (MB) |')
+    print('|---|---|---|---|---|---|')
+    for run in results['runs']:
+        print(f"| {run['rows']} | {run['render_mode']} | {run['total_s']:.1f} | {run['seconds_per_clip']:.2f} | "
+              f"{format_value(run['output_fps'])} | {run['peak_rss_mb']:.0f} |")
+
+    print()
+    print('| Rows | Stage | Calls | Wall (s) | CPU (s) | Peak RSS (MB) |')
+    print('|---|---|---|---|---|---|')
+    for run in results['runs']:
+        for name, stage in run['stages'].items():
+            print(f"| {run['rows']} | {name} | {stage['count']} | {stage['wall_s']:.2f} | {stage['cpu_s']:.2f} | {format_value(stage['peak_rss_mb'], 0)} |")
+
+    print()
+    print('| Rows | Frame phase | p50 (ms) | p95 (ms) | Max (ms) |')
+    print('|---|---|---|---|---|')
+    for run in results['runs']:
+        for phase, summary in run['frames'].items():
+            if summary['count']:
+                print(f"| {run['rows']} | {phase} | {summary['p50_ms']:.1f} | {summary['p95_ms']:.1f} | {summary['max_ms']:.1f} |")
+
+def print_comparison(results, baseline, threshold):
+    # Compare each run with the baseline run of the same row count and render mode, flagging changes for the worse
+    # that are larger than threshold percent.
+    baseline_runs = {(run['rows'], run['render_mode']): run for run in baseline['runs']}
+    print()
+    print(f"Compared with {baseline['created']}:")
+    print()
+    print('| Rows | Metric | Baseline | Now | Change |')
+    print('|---|---|---|---|---|')
+    regressions = 0
+    for run in results['runs']:
+        old = baseline_runs.get((run['rows'], run['render_mode']))
+        if old is None:
+            continue
+        metrics = [(name, old[name], run[name], higher_is_better) for name, higher_is_better in METRICS.items()]
+        metrics += [(f'{name} wall_s', old['stages'][name]['wall_s'], stage['wall_s'], False)
+                    for name, stage in run['stages'].items() if name in old['stages']]
+        for name, before, after, higher_is_better in metrics:
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            worse = change < -threshold if higher_is_better else change > threshold
+            regressions += worse
+            print(f"| {run['rows']} | {name} | {before:.2f} | {after:.2f} | {change:+.1f}%{' (regression)' if worse else ''} |")
+    return regressions
+
+def format_value(value, digits=1):
+    return '-' if value is None else f'{value:.{digits}f}'
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the stage timings and memory use of the recap generator on synthetic media.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[5, 50, 200], help='Numbers of rows in the synthetic video data spreadsheets.')
+    parser.add_argument('--videos', type=int, default=8, help='Number of distinct synthetic videos, shared between the rows.')
+    parser.add_argument('--video-duration', type=float, default=60, help='Length of each synthetic video in seconds.')
+    parser.add_argument('--clip-length', type=int, default=5)
+    parser.add_argument('--render-mode', default='standard', choices=['standard', 'segmented', 'draft'])
+    parser.add_argument('--chorus-detector', default='streaming', choices=['pychorus', 'streaming'])
+    parser.add_argument('--pipeline-workers', type=int, default=1, help='Threads rendering frames ahead of the encoder. 0 means one per CPU core.')
+    parser.add_argument('--workdir', help='Directory for the synthetic media and outputs. Kept between runs so that the videos are only generated once. Defaults to a temporary directory.')
+    parser.add_argument('--output', default='benchmarks/pipeline_results.json', help='Where to save the results as JSON.')
+    parser.add_argument('--compare', help='A results file from an earlier run to compare against.')
+    parser.add_argument('--threshold', type=float, default=10, help='Percentage change treated as a regression by --compare.')
+    parser.add_argument('--run', metavar='OPTIONS', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        # Fonts and the background image are found relative to the repository root.
+        os.chdir(REPO_ROOT)
+        from recap_generator import generate_recap
+        # The run has no stdin, so it must not wait for Enter to be pressed when clips cannot be selected.
+        generate_recap(**json.loads(args.run), interactive=False)
+        return
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix='recap_benchmark_'))
+    workdir.mkdir(parents=True, exist_ok=True)
+    print(f'Generating synthetic media in {workdir}...', file=sys.stderr)
+    video_dir = workdir / 'Videos'
+    video_names = write_video_library(video_dir, max(args.videos, 1), args.video_duration)
+    intro_images = []
+    for name, size in INTRO_IMAGE_SIZES.items():
+        intro_images.append(workdir / f'intro_{name}.png')
+        if not intro_images[-1].exists():
+            write_intro_image(intro_images[-1], size)
+
+    # The baseline is read first, in case it is also the output file.
+    baseline = json.loads(Path(args.compare).read_text(encoding='utf-8')) if args.compare else None
+    results = {'version': RESULTS_VERSION,
+               'created': datetime.now(timezone.utc).isoformat(),
+               'platform': {'system': platform.system(), 'machine': platform.machine(), 'python': platform.python_version(), 'cpu_count': os.cpu_count()},
+               'settings': {key: value for key, value in vars(args).items() if key in ('videos', 'video_duration', 'clip_length', 'render_mode', 'chorus_detector', 'pipeline_workers')},
+               'runs': []}
+    try:
+        for n, rows in enumerate(args.rows):
+            video_data_file = workdir / f'video_data_{rows}.xlsx'
+            write_video_data(video_data_file, video_names, rows, args.clip_length, args.video_duration)
+            # Each run starts with empty caches, so that every stage does its full work.
+            cache_dir = workdir / 'cache'
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            options = {'video_data_file': str(video_data_file),
+                       'video_directory': str(video_dir),
+                       'output_file': str(workdir / f'recap_{rows}.mp4'),
+                       'clip_selection_method': 'auto',
+                       'clip_length': args.clip_length,
+                       'chorus_detector': args.chorus_detector,
+                       'include_intro': True,
+                       # Cycle through tall and wide intro images, fullscreen and not, to cover every way of fitting the overlay.
+                       'use_overlay_intro_image': True,
+                       'intro_image_file': str(intro_images[n % len(intro_images)]),
+                       'intro_image_duration': min(args.clip_length, 3),
+                       'make_intro_image_fullscreen': n % 4 < 2,
+                       'cache_directory': str(cache_dir),
+                       'render_mode': args.render_mode,
+                       'pipeline_workers': args.pipeline_workers,
+                       'incremental_render': False,
+                       'profile_report': str(workdir / f'profile_{rows}.json')}
+            print(f'Benchmarking {rows} rows...', file=sys.stderr)
+            results['runs'].append(summarise(rows, *run_generator(options)))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_tables(results)
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    Path(args.output).write_text(json.dumps(results, indent=2) + '\n', encoding='utf-8')
+    print(f'\nResults saved to {args.output}', file=sys.stderr)
+
+    if baseline:
+        if print_comparison(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
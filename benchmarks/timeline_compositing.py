@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# timeline_compositing.py - Measures the per-frame compositing cost of CompositeVideoClip and TimelineClip.
+#
+# Builds recaps of 10 to 200 synthetic clips laid out like add_crossfade does (each clip crossfading into the next),
+# each with a subtitle layer, and times get_frame at evenly spaced points of the timeline. With a flat
+# CompositeVideoClip the time per frame grows with the clip count; with TimelineClip it should stay flat.
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from moviepy import ColorClip, CompositeVideoClip, ImageClip
+import moviepy.video.fx as vfx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from timeline import TimelineClip
+
+SIZE = (640, 360)
+
+
+def build_layers(n_clips, clip_duration, custom_padding):
+    rng = np.random.default_rng(0)
+    layers = []
+    subtitles = []
+    start = 0
+    for i in range(n_clips):
+        clip = ColorClip(SIZE, color=tuple(int(c) for c in rng.integers(0, 255, 3)), duration=clip_duration).with_fps(25)
+        if i > 0:
+            clip = clip.with_start(start).with_effects([vfx.CrossFadeIn(custom_padding)])
+        layers.append(clip)
+        subtitle = np.full((40, 300, 3), 255, dtype=np.uint8)
+        subtitles.append(ImageClip(subtitle, duration=clip_duration - 2 * custom_padding)
+                         .with_start(start + custom_padding).with_position(('left', 'bottom')))
+        start += clip_duration - custom_padding
+    return layers + subtitles
+
+def time_per_frame(clip, n_samples):
+    times = np.linspace(0, clip.duration, n_samples, endpoint=False)
+    clip.get_frame(times[0])
+    start = time.perf_counter()
+    for t in times:
+        clip.get_frame(t)
+    return (time.perf_counter() - start) / n_samples
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the per-frame compositing cost of CompositeVideoClip and TimelineClip.')
+    parser.add_argument('--clips', type=int, nargs='+', default=[10, 50, 200], help='Numbers of clips in the synthetic recaps.')
+    parser.add_argument('--clip-duration', type=float, default=15)
+    parser.add_argument('--samples', type=int, default=200, help='Number of frames to render from each recap.')
+    args = parser.parse_args()
+
+    print('| Clips | CompositeVideoClip (ms/frame) | TimelineClip (ms/frame) | Speed-up |')
+    print('|---|---|---|---|')
+    for n_clips in args.clips:
+        layers = build_layers(n_clips, args.clip_duration, custom_padding=1)
+        flat = time_per_frame(CompositeVideoClip(layers), args.samples)
+        indexed = time_per_frame(TimelineClip(layers), args.samples)
+        print(f'| {n_clips} | {flat * 1000:.2f} | {indexed * 1000:.2f} | {flat / indexed:.1f}x |')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+# chorus_detector.py - Streaming, bounded-memory chorus detection using FFmpeg and NumPy.
+#
+# The audio track is decoded by FFmpeg as a downsampled mono stream and turned into chroma features chunk by chunk,
+# so the raw audio is never held in memory. Repeated sections are then found by comparing the chroma sequence with
+# lagged copies of itself, a block of lags at a time, so that memory use stays within a fixed budget however long
+# the video is.
+
+import os
+import subprocess
+import numpy as np
+
+FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+
+SAMPLE_RATE = 11025
+FRAME_SIZE = 8192
+HOP_SIZE = 4096
+CHUNK_SECONDS = 30
+# Windows of chroma frames whose mean similarity with an earlier window falls below this are not treated as repeats.
+SIMILARITY_THRESHOLD = 0.8
+
+DETECTOR_PARAMS = {'detector': 'streaming',
+                   'sample_rate': SAMPLE_RATE,
+                   'frame_size': FRAME_SIZE,
+                   'hop_size': HOP_SIZE,
+                   'similarity_threshold': SIMILARITY_THRESHOLD}
+
+
+def find_chorus(input_file, clip_length, memory_budget_mb=256):
+    # Return the start time in seconds of the first occurrence of the best repeated section of length clip_length,
+    # or None if no section repeats.
+    chroma = extract_chroma(decode_audio(input_file))
+    if chroma is None:
+        return None
+
+    frame_rate = SAMPLE_RATE / HOP_SIZE
+    window = max(1, int(round(clip_length * frame_rate)))
+    best = find_repeated_section(chroma, window, memory_budget_mb * 1024 * 1024)
+    if best is None:
+        return None
+
+    start_frame, _, similarity = best
+    if similarity < SIMILARITY_THRESHOLD:
+        return None
+    return start_frame / frame_rate
+
+def decode_audio(input_file, sample_rate=SAMPLE_RATE, chunk_seconds=CHUNK_SECONDS):
+    # Yield the audio track of input_file as chunks of mono float32 samples.
+    cmd = [FFMPEG_BINARY, '-nostdin', '-v', 'error', '-i', str(input_file),
+           '-vn', '-ac', '1', '-ar', str(sample_rate), '-f', 'f32le', '-']
+    chunk_bytes = sample_rate * chunk_seconds * 4
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            data = proc.stdout.read(chunk_bytes)
+            if not data:
+                break
+            yield np.frombuffer(data[:len(data) - len(data) % 4], dtype=np.float32)
+    finally:
+        proc.stdout.close()
+        proc.kill()
+        proc.wait()
+
+def extract_chroma(chunks, sample_rate=SAMPLE_RATE, frame_size=FRAME_SIZE, hop_size=HOP_SIZE):
+    # Compute a (frames x 12) chroma matrix from a stream of sample chunks, normalised so that each frame peaks at 1.
+    window = np.hanning(frame_size).astype(np.float32)
+    pitch_classes = chroma_filter(sample_rate, frame_size)
+
+    tail = np.zeros(0, dtype=np.float32)
+    frames = []
+    for chunk in chunks:
+        samples = np.concatenate([tail, chunk])
+        n_frames = 1 + (len(samples) - frame_size) // hop_size if len(samples) >= frame_size else 0
+        if n_frames:
+            segments = np.lib.stride_tricks.sliding_window_view(samples, frame_size)[::hop_size][:n_frames]
+            spectrum = np.abs(np.fft.rfft(segments * window, axis=1)).astype(np.float32) ** 2
+            frames.append(spectrum @ pitch_classes)
+        tail = samples[n_frames * hop_size:]
+
+    if not frames:
+        return None
+    chroma = np.concatenate(frames)
+    peaks = chroma.max(axis=1, keepdims=True)
+    return chroma / np.where(peaks > 0, peaks, 1)
+
+def chroma_filter(sample_rate, frame_size, min_freq=55.0, max_freq=4000.0):
+    # Map each FFT bin within the musical range onto one of the 12 pitch classes.
+    freqs = np.fft.rfftfreq(frame_size, 1 / sample_rate)
+    in_range = (freqs >= min_freq) & (freqs <= max_freq)
+    pitch_class = np.round(12 * np.log2(np.where(in_range, freqs, 440.0) / 440.0) + 69).astype(int) % 12
+    pitch_classes = np.zeros((len(freqs), 12), dtype=np.float32)
+    pitch_classes[np.nonzero(in_range)[0], pitch_class[in_range]] = 1
+    return pitch_classes
+
+def find_repeated_section(chroma, window, memory_budget_bytes):
+    # Search every lag of at least one window for the window of frames that best matches the frames one lag earlier.
+    # Returns (start frame of the earlier occurrence, lag, mean similarity), or None if the audio is too short.
+    n_frames = len(chroma)
+    max_lag = n_frames - window
+    if max_lag < window:
+        return None
+
+    # Each block of lags is computed in buffers allocated once, so that no temporaries grow with the block. Each lag
+    # needs a row of gathered chroma frames, which then holds their difference from the original (float32), a row of
+    # frame indexes (int64), a similarity row (float32) and rows of running sums and window means (float64).
+    bytes_per_lag = n_frames * (chroma.shape[1] * 4 + 8 + 4 + 2 * 8)
+    block_size = min(max(1, int(memory_budget_bytes // bytes_per_lag)), max_lag - window + 1)
+    norm = np.sqrt(chroma.shape[1])
+    frame_idxs = np.arange(n_frames)
+    diffs = np.empty((block_size, n_frames, chroma.shape[1]), dtype=chroma.dtype)
+    earlier = np.empty((block_size, n_frames), dtype=np.int64)
+    similarity = np.empty((block_size, n_frames), dtype=np.float32)
+    # Running sums start with a column of zeros, so that the sum of every window is the difference of two columns.
+    sums = np.zeros((block_size, n_frames + 1))
+    window_means = np.empty((block_size, n_frames - window + 1))
+
+    best = None
+    for block_start in range(window, max_lag + 1, block_size):
+        lags = np.arange(block_start, min(block_start + block_size, max_lag + 1))
+        n_lags = len(lags)
+        np.subtract(frame_idxs[None, :], lags[:, None], out=earlier[:n_lags])
+        # Negative indexes are clipped to the first frame. mode='raise' would gather into a temporary copy first.
+        np.take(chroma, earlier[:n_lags], axis=0, out=diffs[:n_lags], mode='clip')
+        np.subtract(chroma[None, :, :], diffs[:n_lags], out=diffs[:n_lags])
+        np.einsum('lij,lij->li', diffs[:n_lags], diffs[:n_lags], out=similarity[:n_lags])
+        np.sqrt(similarity[:n_lags], out=similarity[:n_lags])
+        np.divide(similarity[:n_lags], norm, out=similarity[:n_lags])
+        np.subtract(1, similarity[:n_lags], out=similarity[:n_lags])
+        # Frames with no frame one lag earlier do not count.
+        for i, lag in enumerate(lags):
+            similarity[i, :lag] = 0
+
+        # Mean similarity of each window of frames, indexed by its first frame, with the window one lag earlier.
+        # The similarities are copied into the sums first, as a cumulative sum that also casts makes a temporary copy.
+        np.copyto(sums[:n_lags, 1:], similarity[:n_lags])
+        np.cumsum(sums[:n_lags, 1:], axis=1, out=sums[:n_lags, 1:])
+        np.subtract(sums[:n_lags, window:], sums[:n_lags, :n_frames - window + 1], out=window_means[:n_lags])
+        np.divide(window_means[:n_lags], window, out=window_means[:n_lags])
+        # Only windows lying entirely after their lag are valid.
+        for i, lag in enumerate(lags):
+            window_means[i, :lag] = -np.inf
+
+        lag_idx, start = np.unravel_index(np.argmax(window_means[:n_lags]), (n_lags, window_means.shape[1]))
+        if best is None or window_means[lag_idx, start] > best[2]:
+            best = (int(start - lags[lag_idx]), int(lags[lag_idx]), float(window_means[lag_idx, start]))
+
+    return best
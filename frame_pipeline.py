@@ -0,0 +1,126 @@
+# frame_pipeline.py - Renders the frames of a recap ahead of the encoder on several threads.
+#
+# MoviePy asks for one frame at a time and encodes it before asking for the next, so decoding, resizing, compositing
+# and encoding all run one after another. While a recap is being written inside pipelined(), frame requests are
+# instead answered from a bounded queue of frames that are already being rendered by a pool of compositing threads.
+# Each source clip gets a decoding thread of its own, which decodes and resizes its frames ahead of the compositing
+# threads. A source is always asked for its frames in the same order as in a sequential render, so the output is
+# identical. The queue only runs frame_queue_size frames ahead of the encoder, which bounds the memory used.
+
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+class SourceFeed:
+    # Decodes the frames of one source clip on a single thread, in the order in which they were requested.
+
+    def __init__(self, source, end):
+        self.source = source
+        self.get_frame = source.get_frame
+        # The time in the recap after which the source is no longer shown.
+        self.end = end
+        # Frames being decoded, by clip time, along with the output frame that asked for them.
+        self.pending = {}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def request(self, t, frame_index=None):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='decode')
+            future = self._executor.submit(self.get_frame, t)
+            if frame_index is not None:
+                self.pending[t] = (frame_index, future)
+        return future
+
+    def frame(self, t):
+        # Replaces source.get_frame. Frames that were not requested ahead are still decoded on the feed's thread.
+        with self._lock:
+            entry = self.pending.pop(t, None)
+        future = entry[1] if entry else self.request(t)
+        return future.result()
+
+    def release(self, frame_index):
+        # Forget frames requested for output frames up to frame_index, which have all been rendered by now.
+        with self._lock:
+            for t, (index, _) in list(self.pending.items()):
+                if index <= frame_index:
+                    del self.pending[t]
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+@contextmanager
+def pipelined(recap, fps, workers=1, frame_queue_size=16):
+    # Render the frames of recap ahead of the encoder while the body of the with statement writes it at fps.
+    # Layers of recap that were made by letterbox() have their source frames decoded and resized ahead as well.
+    # With a single worker, frames are rendered one at a time as usual.
+    if workers <= 1:
+        yield recap
+        return
+
+    frame_function = recap.frame_function
+    n_frames = int(recap.duration * fps)
+    feeds = {}
+    for layer in recap.clips:
+        source = getattr(layer, 'letterbox_source', None)
+        if source is not None and id(source) not in feeds:
+            feeds[id(source)] = SourceFeed(source, layer.end)
+            source.get_frame = feeds[id(source)].frame
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='composite')
+    queue = deque()
+    next_frame = [0]
+    # The feeds of the sources that frames have been requested from and which have not finished yet.
+    active_feeds = {}
+
+    def schedule(frame_index):
+        # Request the source frames that rendering this frame will ask for, then queue the frame itself. The
+        # prediction mirrors CompositeVideoClip and letterbox(): each playing layer is asked for its frame at the
+        # clip time t - start, and the layer asks its source for that frame while the source has not ended.
+        t = frame_index / fps
+        for layer in recap.playing_clips(t):
+            source = getattr(layer, 'letterbox_source', None)
+            layer_t = t - layer.start
+            if source is not None and layer_t < source.duration:
+                feeds[id(source)].request(layer_t, frame_index)
+                active_feeds[id(source)] = feeds[id(source)]
+        queue.append((frame_index, executor.submit(frame_function, t)))
+
+    def pipelined_frame_function(t):
+        frame_index = round(t * fps)
+        if frame_index / fps != t or not 0 <= frame_index < n_frames:
+            return frame_function(t)
+        if not queue or queue[0][0] != frame_index:
+            if queue or frame_index != next_frame[0]:
+                # Out of order requests are rendered directly.
+                return frame_function(t)
+        while next_frame[0] < min(frame_index + frame_queue_size, n_frames):
+            schedule(next_frame[0])
+            next_frame[0] += 1
+        _, future = queue.popleft()
+        frame = future.result()
+        for key, feed in list(active_feeds.items()):
+            feed.release(frame_index)
+            # Stop the decoding threads of sources that have finished, rather than keeping one per clip.
+            if feed.end is not None and t >= feed.end:
+                feed.close()
+                del active_feeds[key]
+        return frame
+
+    recap.frame_function = pipelined_frame_function
+    try:
+        yield recap
+    finally:
+        recap.frame_function = frame_function
+        executor.shutdown(wait=False, cancel_futures=True)
+        for feed in feeds.values():
+            feed.close()
+            # Remove the replacement so that the class's get_frame is used again.
+            del feed.source.get_frame
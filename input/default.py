@@ -8,7 +8,7 @@ default_schema = {
         "video_data_file": {
             "type": "string",
             "default": "video_data.xlsx",
-            "description": "The path to the video data spreadsheet. Must be an XLSX file."
+            "description": "The path to the video data spreadsheet. Must be an XLSX file, or a CSV file with the same columns."
         },
         "video_directory": {
             "type": "string",
@@ -111,6 +111,131 @@ default_schema = {
             "type": "number",
             "default": 3,
             "description": "The thickness of the intro text outline."
+        },
+        "chorus_detector": {
+            "type": "string",
+            "default": "pychorus",
+            "enum": ["pychorus", "streaming"],
+            "description": "The chorus detection engine. 'streaming' decodes audio in chunks and keeps memory use within chorus_memory_budget_mb, which suits long videos."
+        },
+        "chorus_memory_budget_mb": {
+            "type": "number",
+            "default": 256,
+            "description": "The memory budget in megabytes for the repeated section search of the streaming chorus detector."
+        },
+        "chorus_workers": {
+            "type": "integer",
+            "default": 1,
+            "minimum": 0,
+            "description": "The number of worker processes used for chorus detection. Set to 0 to use all available CPU cores."
+        },
+        "use_chorus_cache": {
+            "type": "boolean",
+            "default": True,
+            "description": "If True, chorus detection results are cached on disk and reused on later runs."
+        },
+        "chorus_cache_hash_content": {
+            "type": "boolean",
+            "default": False,
+            "description": "If True, cached results are keyed by a hash of the video file contents rather than its name, size and modification time."
+        },
+        "cache_directory": {
+            "type": "string",
+            "default": ".recap_cache",
+            "description": "The directory in which cached results are stored."
+        },
+        "cache_max_size_mb": {
+            "type": "number",
+            "default": 64,
+            "description": "The maximum size of each cache in megabytes. The least recently used entries are evicted beyond this size."
+        },
+        "text_cache_max_size_mb": {
+            "type": "number",
+            "default": 256,
+            "description": "The maximum size in megabytes of the cache of rendered subtitle text, which is kept separately as its images are larger than the other cached results."
+        },
+        "render_mode": {
+            "type": "string",
+            "default": "standard",
+            "enum": ["standard", "segmented", "draft"],
+            "description": "'segmented' encodes each clip and crossfade as a separate segment in parallel worker processes, then joins them without re-encoding. 'draft' renders a quick low-resolution preview from cached proxies of the videos, saved next to the output file with .draft added to its name."
+        },
+        "render_workers": {
+            "type": "integer",
+            "default": 0,
+            "minimum": 0,
+            "description": "The number of worker processes used in the segmented render mode. Set to 0 to use all available CPU cores."
+        },
+        "incremental_render": {
+            "type": "boolean",
+            "default": True,
+            "description": "If True, the segmented render mode keeps its segments and a manifest next to the output file, and only re-renders segments that have changed."
+        },
+        "audio_normalization": {
+            "type": "string",
+            "default": "peak",
+            "enum": ["peak", "loudness"],
+            "description": "How clip audio is normalised. 'peak' scales each clip so that its loudest sample is at full volume. 'loudness' brings each clip to loudness_target, for more consistent levels between clips."
+        },
+        "loudness_target": {
+            "type": "number",
+            "default": -16,
+            "description": "The integrated loudness in LUFS that clips are brought to when audio_normalization is 'loudness'."
+        },
+        "loudness_workers": {
+            "type": "integer",
+            "default": 0,
+            "minimum": 0,
+            "description": "The number of clips whose audio levels are measured at once. Each measurement runs in an FFmpeg process of its own. Set to 0 to use all available CPU cores."
+        },
+        "draft_scale": {
+            "type": "number",
+            "default": 0.25,
+            "description": "The scale of the draft render mode's video relative to 1920x1080, e.g. 0.25 renders at 480x270."
+        },
+        "draft_fps": {
+            "type": "number",
+            "default": 12,
+            "description": "The frame rate of the draft render mode."
+        },
+        "proxy_workers": {
+            "type": "integer",
+            "default": 2,
+            "minimum": 0,
+            "description": "The number of videos transcoded into proxies at once in the draft render mode. FFmpeg already uses several threads for each video. Set to 0 to transcode one video per CPU core."
+        },
+        "proxy_cache_max_size_mb": {
+            "type": "number",
+            "default": 2048,
+            "description": "The maximum size in megabytes of the cache of low-resolution proxy videos used by the draft render mode."
+        },
+        "profile_report": {
+            "type": "string",
+            "default": "",
+            "description": "The path of a JSON report of the time, CPU and memory used by each stage, and of per-frame render timings. Leave empty to disable profiling."
+        },
+        "pipeline_workers": {
+            "type": "integer",
+            "default": 1,
+            "minimum": 0,
+            "description": "The number of threads that render frames ahead of the encoder in the standard and draft render modes. 1 renders one frame at a time. Set to 0 to use all available CPU cores."
+        },
+        "frame_queue_size": {
+            "type": "integer",
+            "default": 16,
+            "minimum": 1,
+            "description": "The maximum number of frames rendered ahead of the encoder. Higher values can keep more threads busy but use more memory."
+        },
+        "max_open_readers": {
+            "type": "integer",
+            "default": 4,
+            "minimum": 0,
+            "description": "The maximum number of video and audio readers kept open at once. Readers are reopened when their clip is next needed. Set to 0 to keep every reader open."
+        },
+        "worksheet": {
+            "type": "string",
+            "default": "",
+            "description": "The name of the worksheet in the video data spreadsheet to read. Leave empty to read the active worksheet. Not used for CSV files."
         }
     }
 }
\ No newline at end of file
@@ -0,0 +1,86 @@
+# letterbox.py - Fits clips onto a fixed-size canvas without compositing static layers on every frame.
+#
+# Static images (the black background and the intro image overlay) are decoded and resized once and cached as arrays.
+# Each letterboxed clip owns a canvas buffer that starts as a copy of the background. Every frame, the resized source
+# frame is written into its centred region of the buffer, so the borders never need to be redrawn. Frames may be
+# rendered on several threads at once, so each thread gets a buffer of its own.
+
+import os
+import threading
+import numpy as np
+
+CANVAS_SIZE = (1920, 1080)
+
+# Decoded static layers, keyed by file and target size.
+_static_layers = {}
+
+
+def load_static_layer(image_file, size=None, height=None, width=None):
+    # Return (rgb, alpha) arrays for an image resized to the given size, height or width. alpha is None if the image
+    # has no transparency. Each combination is only decoded and resized once.
+    stat = os.stat(image_file)
+    key = (os.path.realpath(image_file), stat.st_mtime_ns, size, height, width)
+    if key not in _static_layers:
+        from moviepy import ImageClip
+        img_clip = ImageClip(image_file)
+        if size:
+            img_clip = img_clip.resized(size)
+        elif height:
+            img_clip = img_clip.resized(height=height)
+        elif width:
+            img_clip = img_clip.resized(width=width)
+        rgb = img_clip.get_frame(0).astype(np.uint8)
+        alpha = img_clip.mask.get_frame(0)[:, :, np.newaxis] if img_clip.mask is not None else None
+        _static_layers[key] = (rgb, alpha)
+    return _static_layers[key]
+
+def letterbox(clip, background_file, canvas_size=CANVAS_SIZE, overlay=None, overlay_duration=0):
+    # Resize clip to fit the canvas while maintaining its aspect ratio and centre it over the background image.
+    # If given, the (rgb, alpha) overlay is centred over the clip for its first overlay_duration seconds.
+    from moviepy import VideoClip
+    canvas_w, canvas_h = canvas_size
+    if clip.w / clip.h <= canvas_w / canvas_h:
+        resized = clip.resized(height=canvas_h)
+    else:
+        resized = clip.resized(width=canvas_w)
+    x, y = int((canvas_w - resized.w) / 2), int((canvas_h - resized.h) / 2)
+    w, h = resized.w, resized.h
+
+    background = load_static_layer(background_file, size=canvas_size)[0]
+    buffers = threading.local()
+
+    if overlay is not None:
+        overlay_rgb, overlay_alpha = overlay
+        ow, oh = overlay_rgb.shape[1], overlay_rgb.shape[0]
+        ox, oy = int((canvas_w - ow) / 2), int((canvas_h - oh) / 2)
+        # Overlays larger than the canvas are cropped to it.
+        crop = (slice(max(0, -oy), max(0, -oy) + min(oh, canvas_h)), slice(max(0, -ox), max(0, -ox) + min(ow, canvas_w)))
+        region = (slice(max(0, oy), max(0, oy) + min(oh, canvas_h)), slice(max(0, ox), max(0, ox) + min(ow, canvas_w)))
+        overlay_rgb = overlay_rgb[crop].astype(np.float32)
+        overlay_alpha = overlay_alpha[crop] if overlay_alpha is not None else None
+
+    def frame_function(t):
+        buffer = getattr(buffers, 'buffer', None)
+        if buffer is None:
+            buffer = buffers.buffer = background.copy()
+        if overlay is not None:
+            # The overlay may cover the borders, so restore them from the background before drawing this frame.
+            buffer[region] = background[region]
+        if t < resized.duration:
+            buffer[y:y+h, x:x+w] = resized.get_frame(t)
+        else:
+            buffer[y:y+h, x:x+w] = background[y:y+h, x:x+w]
+        if overlay is not None and t < overlay_duration:
+            if overlay_alpha is None:
+                buffer[region] = overlay_rgb
+            else:
+                buffer[region] = np.rint(overlay_rgb * overlay_alpha + buffer[region] * (1 - overlay_alpha)).astype(np.uint8)
+        return buffer
+
+    duration = max(clip.duration, overlay_duration) if overlay is not None else clip.duration
+    letterboxed = VideoClip(frame_function=frame_function, duration=duration).with_fps(clip.fps)
+    if clip.audio is not None:
+        letterboxed = letterboxed.with_audio(clip.audio)
+    # The resized clip whose frames are drawn into the canvas, so that they can be decoded ahead (see frame_pipeline.py).
+    letterboxed.letterbox_source = resized
+    return letterboxed
@@ -0,0 +1,75 @@
+# loudness.py - Single-pass loudness analysis of clip audio, cached per file and time range.
+#
+# Each clip's audio is measured once by FFmpeg's EBU R128 filter, which reports both the sample peak and the integrated
+# loudness in a single streamed pass. The measurements are cached, and the gain they imply is applied to the clip when
+# it is rendered, rather than decoding the audio an extra time per clip to find its peak as AudioNormalize does.
+
+import math
+import os
+import re
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+from recap_cache import DiskCache, file_fingerprint
+from segments import to_seconds
+
+FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+
+# Audio is analysed at the sample rate MoviePy decodes it at, so that sample peaks match AudioNormalize.
+SAMPLE_RATE = 44100
+
+# MoviePy decodes audio as 16-bit stereo, so audio is converted the same way before it is measured. Mono audio is
+# copied to both channels and surround audio is downmixed, which FFmpeg only scales to avoid clipping for integer
+# sample formats.
+SAMPLE_FORMAT = 's16'
+CHANNEL_LAYOUT = 'stereo'
+
+# The sample peak is measured by astats. ebur128's own sample peak reads 3 dB high for mono sources, so ebur128 only
+# measures the integrated loudness.
+ANALYSIS_PARAMS = {'analyser': 'ebur128', 'peak': 'astats', 'sample_rate': SAMPLE_RATE, 'sample_format': SAMPLE_FORMAT, 'channel_layout': CHANNEL_LAYOUT}
+
+
+def analyse_loudness(input_file, start, end):
+    # Return {'peak': linear sample peak, 'integrated_lufs': integrated loudness} for the audio of input_file between
+    # start and end seconds. Either value is None if the file has no audio or the range is silent.
+    cmd = [FFMPEG_BINARY, '-nostdin', '-hide_banner', '-nostats', '-ss', str(start), '-t', str(end - start), '-i', str(input_file),
+           '-vn', '-af', f'aresample={SAMPLE_RATE},aformat=sample_fmts={SAMPLE_FORMAT}:channel_layouts={CHANNEL_LAYOUT},'
+                  f'astats=measure_perchannel=none:measure_overall=Peak_level,ebur128=framelog=verbose', '-f', 'null', '-']
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, errors='replace')
+
+    summary = result.stderr[result.stderr.rfind('Summary:'):] if 'Summary:' in result.stderr else ''
+    integrated = re.search(r'I:\s+(-?[\d.]+|-inf) LUFS', summary)
+    peak = re.search(r'Peak level dB:\s+(-?[\d.]+|-inf)', result.stderr)
+    integrated_lufs = float(integrated.group(1)) if integrated else None
+    peak_db = float(peak.group(1)) if peak else None
+    return {'peak': 10 ** (peak_db / 20) if peak_db is not None and math.isfinite(peak_db) else None,
+            'integrated_lufs': integrated_lufs if integrated_lufs is not None and integrated_lufs > -70 else None}
+
+def cached_loudness(input_file, start, end, cache=None, hash_content=False):
+    # Measure the loudness of a clip, reusing the cached measurement for the same file and time range if there is one.
+    key = DiskCache.make_key(file_fingerprint(input_file, hash_content), round(start, 6), round(end, 6), ANALYSIS_PARAMS) if cache else None
+    with cache.lock(key) if cache else nullcontext():
+        measurement = cache.get(key) if cache else None
+        if measurement is None:
+            measurement = {'source': Path(input_file).name, 'start': start, 'end': end, **analyse_loudness(input_file, start, end)}
+            if cache:
+                cache.put(key, measurement)
+    return measurement
+
+def normalisation_gain(measurement, method='peak', target_lufs=-16):
+    # The linear gain to apply to a clip. 'peak' scales the sample peak to full scale, matching AudioNormalize.
+    # 'loudness' brings the integrated loudness to target_lufs, limited so that the clip does not clip.
+    peak = measurement['peak']
+    if not peak:
+        return 1.0
+    if method == 'loudness' and measurement['integrated_lufs'] is not None:
+        return min(10 ** ((target_lufs - measurement['integrated_lufs']) / 20), 1 / peak)
+    return 1 / peak
+
+def clip_gains(video_files, clip_ranges, method='peak', target_lufs=-16, workers=1, cache=None, hash_content=False):
+    # Work out the gain of every clip, analysing the clips in parallel. FFmpeg does the decoding, so threads suffice.
+    ranges = [(to_seconds(start), to_seconds(end)) for start, end in clip_ranges]
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        measurements = list(executor.map(lambda i: cached_loudness(video_files[i], *ranges[i], cache, hash_content), range(len(video_files))))
+    return [normalisation_gain(measurement, method, target_lufs) for measurement in measurements]
@@ -0,0 +1,136 @@
+# planning.py - Checks a recap before it is rendered and works out its timeline from media metadata alone.
+#
+# Every video is probed with ffprobe, which only reads the container headers, so probing even hundreds of files takes
+# seconds. The probes run in parallel threads. Each row of the spreadsheet is then checked against its video (the file
+# exists and is readable, and the clip times are valid and within the video) and the timeline the recap would have is
+# worked out with the same functions the renderer uses, so problems are found before any audio is analysed.
+
+import json
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from segments import clip_offsets, subtitle_windows, to_seconds
+
+FFPROBE_BINARY = os.environ.get('FFPROBE_BINARY', 'ffprobe')
+
+
+def probe_media(input_file):
+    # Return {'duration', 'width', 'height', 'fps', 'has_video', 'has_audio'} for a media file, or {'error': message}.
+    if not os.path.isfile(input_file):
+        return {'error': 'file not found'}
+    cmd = [FFPROBE_BINARY, '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', str(input_file)]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, errors='replace')
+    except FileNotFoundError:
+        return {'error': f'{FFPROBE_BINARY} not found. Please install FFmpeg.'}
+    if result.returncode != 0:
+        return {'error': result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'unreadable file'}
+
+    info = json.loads(result.stdout or '{}')
+    streams = info.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video' and not s.get('disposition', {}).get('attached_pic')), None)
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+    duration = info.get('format', {}).get('duration') or (video or {}).get('duration')
+    media = {'duration': float(duration) if duration not in (None, 'N/A') else None,
+             'has_video': video is not None,
+             'has_audio': audio is not None,
+             'width': None, 'height': None, 'fps': None}
+    if video is not None:
+        media['width'], media['height'] = video.get('width'), video.get('height')
+        # Videos recorded in portrait are often stored in landscape with a rotation, which FFmpeg applies when decoding.
+        rotation = int(float(video.get('tags', {}).get('rotate', 0) or 0))
+        for side_data in video.get('side_data_list', []):
+            rotation = int(float(side_data.get('rotation', rotation)))
+        if abs(rotation) % 180 == 90:
+            media['width'], media['height'] = media['height'], media['width']
+        num, _, den = (video.get('avg_frame_rate') or '0/0').partition('/')
+        media['fps'] = float(num) / float(den) if den and float(den) else None
+    return media
+
+def probe_all(input_files, workers=0):
+    # Probe several files in parallel, returning {file: media info}. Each distinct file is only probed once.
+    unique_files = list(dict.fromkeys(input_files))
+    with ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) * 4)) as executor:
+        return dict(zip(unique_files, executor.map(probe_media, unique_files)))
+
+def check_rows(rows, media, clip_selection_method, clip_length, custom_padding):
+    # Check each row against its probed video and work out the clip duration it will have.
+    # rows are dicts with the spreadsheet 'row' number, the video 'id' and 'file', and the 'start' and 'end' cells.
+    # Returns (durations, problems, notes):
+    # problems stop the recap from rendering, notes are worth knowing about. Rows left to chorus detection are assumed
+    # to last clip_length seconds.
+    durations = []
+    problems = []
+    notes = []
+    for row in rows:
+        info = media[row['file']]
+        label = f"Row {row['row']} ({row['id']})"
+        if 'error' in info:
+            problems.append(f"{label}: {info['error']}")
+        elif not info['has_video']:
+            problems.append(f'{label}: no video stream')
+
+        manual = clip_selection_method == 'manual' or bool(row['start'] and row['end'])
+        if not manual:
+            if row['start'] or row['end']:
+                notes.append(f'{label}: only one of the clip start and end times is set, so the clip will be chosen by chorus detection')
+            if 'error' not in info and not info['has_audio']:
+                problems.append(f'{label}: no audio stream for chorus detection. Please choose a clip manually.')
+            elif info.get('duration') is not None and info['duration'] < clip_length:
+                problems.append(f"{label}: the video is only {info['duration']:.1f}s long, shorter than clip_length ({clip_length}s)")
+            durations.append(clip_length)
+            continue
+
+        if not (row['start'] and row['end']):
+            problems.append(f'{label}: the clip start and end times are required when clip_selection_method is manual')
+            durations.append(clip_length)
+            continue
+        try:
+            start, end = to_seconds(str(row['start'])), to_seconds(str(row['end']))
+        except ValueError:
+            problems.append(f"{label}: invalid clip times '{row['start']}' to '{row['end']}'. Use seconds or hh:mm:ss.")
+            durations.append(clip_length)
+            continue
+        if start < 0 or end <= start:
+            problems.append(f"{label}: the clip end ({row['end']}) must be after its start ({row['start']})")
+        elif info.get('duration') is not None and end > info['duration']:
+            problems.append(f"{label}: the clip ends at {end:g}s but the video is only {info['duration']:.1f}s long")
+        elif end - start < 2 * custom_padding:
+            problems.append(f'{label}: the clip is {end - start:g}s long, shorter than its crossfades ({2 * custom_padding}s)')
+        if 'error' not in info and not info['has_audio']:
+            notes.append(f'{label}: no audio stream')
+        durations.append(max(end - start, 0))
+    return durations, problems, notes
+
+def check_files(options):
+    # Check the files named in the options, other than the videos. Returns a list of problems.
+    problems = []
+    for name in ['sub_font_file'] + (['intro_font_file'] if options['include_intro'] else []):
+        # Fonts may also be given by name, so only paths to missing files are reported.
+        font = options[name]
+        if (os.sep in font or '/' in font or font.lower().endswith(('.ttf', '.otf'))) and not os.path.isfile(font):
+            problems.append(f'{name}: {font} not found')
+    if options['use_overlay_intro_image']:
+        image = probe_media(options['intro_image_file'])
+        if 'error' in image:
+            problems.append(f"intro_image_file: {options['intro_image_file']}: {image['error']}")
+    output_dir = Path(options['output_file']).resolve().parent
+    if not output_dir.is_dir():
+        problems.append(f'output_file: the directory {output_dir} does not exist')
+    return problems
+
+def timeline(durations, custom_padding, include_intro):
+    # The (start, end) of each clip in the recap, the (start, end) of the crossfade into it (None for the first clip)
+    # and the (start, end) of its subtitle, as the renderer will lay them out.
+    offsets = clip_offsets(durations, custom_padding)
+    windows = subtitle_windows(durations, custom_padding, include_intro)
+    return [{'clip': (offsets[i], offsets[i] + durations[i]),
+             'crossfade': (offsets[i], offsets[i] + custom_padding) if i > 0 else None,
+             'subtitle': windows[i]}
+            for i in range(len(durations))]
+
+def format_time(seconds):
+    # m:ss.s
+    sign, seconds = ('-' if seconds < 0 else ''), abs(seconds)
+    return f'{sign}{int(seconds // 60)}:{seconds % 60:04.1f}'
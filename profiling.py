@@ -0,0 +1,218 @@
+# profiling.py - Stage timings and per-frame render latencies, written to a JSON report.
+#
+# A StageProfiler records the wall time, CPU time and peak resident memory of each named stage of a run. While the recap
+# is written, it can also time every frame, splitting it into decoding (reading frames from the source videos),
+# compositing (everything else needed to build the frame) and encoding (the time until the next frame is requested,
+# which is spent writing the frame to FFmpeg). Each of these is summarised as a histogram with percentiles.
+
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where child process CPU time and the peak RSS fallback are not recorded.
+    resource = None
+
+REPORT_VERSION = 1
+
+# Upper bounds in milliseconds of the histogram buckets. The last bucket holds everything slower.
+BUCKET_BOUNDS_MS = [0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+# How often peak memory use is sampled, in seconds.
+RSS_SAMPLE_INTERVAL = 0.05
+
+
+class Histogram:
+    # Latency samples in seconds, summarised as bucket counts and percentiles.
+
+    def __init__(self):
+        self.samples = []
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def summary(self):
+        samples = sorted(self.samples)
+        if not samples:
+            return {'count': 0}
+        counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        bound_idx = 0
+        for sample in samples:
+            while bound_idx < len(BUCKET_BOUNDS_MS) and sample * 1000 > BUCKET_BOUNDS_MS[bound_idx]:
+                bound_idx += 1
+            counts[bound_idx] += 1
+        labels = [f'<={bound}ms' for bound in BUCKET_BOUNDS_MS] + [f'>{BUCKET_BOUNDS_MS[-1]}ms']
+        return {'count': len(samples),
+                'total_s': sum(samples),
+                'mean_ms': sum(samples) / len(samples) * 1000,
+                'p50_ms': percentile(samples, 50) * 1000,
+                'p95_ms': percentile(samples, 95) * 1000,
+                'p99_ms': percentile(samples, 99) * 1000,
+                'max_ms': samples[-1] * 1000,
+                'buckets': {label: count for label, count in zip(labels, counts) if count}}
+
+
+class StageProfiler:
+    # Records stages and frame latencies. A disabled profiler does nothing, so callers never need to check for one.
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = []
+        self.frames = {'decode': Histogram(), 'composite': Histogram(), 'encode': Histogram()}
+        self.started = datetime.now(timezone.utc).isoformat()
+        self._open_stages = []
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._stop_sampling = threading.Event()
+
+    @contextmanager
+    def stage(self, name, **details):
+        # Time the body of the with statement as a stage. Stages may be nested, e.g. each video within extract_clips,
+        # in which case the depth of the inner stages is greater than that of the stage containing them.
+        if not self.enabled:
+            yield
+            return
+        self._start_sampler()
+        record = {'name': name, **details, 'depth': len(self._open_stages), 'peak_rss_mb': None}
+        with self._lock:
+            self.stages.append(record)
+            self._open_stages.append(record)
+        self._sample_rss()
+        wall, cpu, child_cpu = time.perf_counter(), time.process_time(), children_cpu_time()
+        try:
+            yield
+        finally:
+            record['wall_s'] = time.perf_counter() - wall
+            record['cpu_s'] = time.process_time() - cpu
+            record['child_cpu_s'] = children_cpu_time() - child_cpu if resource else None
+            self._sample_rss()
+            with self._lock:
+                self._open_stages.remove(record)
+
+    @contextmanager
+    def instrument_frames(self, recap, video_clips):
+        # Time every frame requested from recap while the body of the with statement runs, e.g. during write_videofile.
+        # Decoding is timed for every source frame read by the frame readers of the source clips, compositing is the
+        # rest of each frame and encoding is the gap between one frame being returned and the next being requested.
+        # When frames are rendered ahead by frame_pipeline, compositing is the time spent waiting for each frame.
+        if not self.enabled:
+            yield
+            return
+        local = threading.local()
+        readers = {id(clip.reader): clip.reader for clip in video_clips if getattr(clip, 'reader', None) is not None}
+        originals = {key: reader.get_frame for key, reader in readers.items()}
+
+        def timed_reader(get_frame):
+            def get_frame_timed(t):
+                start = time.perf_counter()
+                try:
+                    return get_frame(t)
+                finally:
+                    elapsed = time.perf_counter() - start
+                    self.frames['decode'].record(elapsed)
+                    local.decode = getattr(local, 'decode', 0) + elapsed
+            return get_frame_timed
+
+        frame_function = recap.frame_function
+        last_frame_end = [None]
+
+        def timed_frame_function(t):
+            start = time.perf_counter()
+            if last_frame_end[0] is not None:
+                self.frames['encode'].record(start - last_frame_end[0])
+            local.decode = 0
+            frame = frame_function(t)
+            end = time.perf_counter()
+            self.frames['composite'].record(end - start - local.decode)
+            last_frame_end[0] = end
+            return frame
+
+        for key, reader in readers.items():
+            reader.get_frame = timed_reader(originals[key])
+        recap.frame_function = timed_frame_function
+        try:
+            yield
+        finally:
+            recap.frame_function = frame_function
+            for key, reader in readers.items():
+                reader.get_frame = originals[key]
+
+    def report(self, **metadata):
+        return {'version': REPORT_VERSION,
+                'started': self.started,
+                'platform': {'system': platform.system(), 'python': platform.python_version(), 'cpu_count': os.cpu_count()},
+                **metadata,
+                'stages': self.stages,
+                'frames': {name: histogram.summary() for name, histogram in self.frames.items()}}
+
+    def write_report(self, report_file, **metadata):
+        self.close()
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(self.report(**metadata), f, indent=2)
+
+    def close(self):
+        # Stop sampling memory in the background. Called once the profiled run has finished, whether or not it succeeded.
+        self._stop_sampler()
+
+    def _start_sampler(self):
+        # Memory is sampled in the background so that peaks in the middle of a stage are caught.
+        if self._sampler is None and current_rss() is not None:
+            self._sampler = threading.Thread(target=self._sample_loop, name='rss-sampler', daemon=True)
+            self._sampler.start()
+
+    def _stop_sampler(self):
+        if self._sampler is not None:
+            self._stop_sampling.set()
+            self._sampler.join()
+            self._sampler = None
+            self._stop_sampling.clear()
+
+    def _sample_loop(self):
+        while not self._stop_sampling.wait(RSS_SAMPLE_INTERVAL):
+            self._sample_rss()
+
+    def _sample_rss(self):
+        rss = current_rss()
+        if rss is None:
+            return
+        with self._lock:
+            for record in self._open_stages:
+                if record['peak_rss_mb'] is None or rss > record['peak_rss_mb']:
+                    record['peak_rss_mb'] = rss
+
+
+# Used wherever no profiling was asked for.
+NULL_PROFILER = StageProfiler(enabled=False)
+
+
+def current_rss():
+    # The resident memory of this process in megabytes, or None if it cannot be measured.
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource:
+        # Elsewhere, fall back to the peak since the process started. ru_maxrss is in bytes on macOS and KB on Linux.
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / 1024 / 1024 if sys.platform == 'darwin' else maxrss / 1024
+    return None
+
+def children_cpu_time():
+    # The CPU time of child processes that have finished, such as FFmpeg and pool workers.
+    if not resource:
+        return 0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def percentile(sorted_samples, pct):
+    # Nearest-rank percentile of a sorted list.
+    rank = max(0, min(len(sorted_samples) - 1, round(pct / 100 * len(sorted_samples)) - 1))
+    return sorted_samples[rank]
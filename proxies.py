@@ -0,0 +1,40 @@
+# proxies.py - Low-resolution, low frame rate proxies of the source videos for draft renders.
+#
+# Each source video is transcoded once with a fast preset and the proxy is kept in the on-disk cache, keyed by the
+# source file and the proxy settings. Proxies keep the timing and audio of their source, so a draft built from them
+# has the same clip timing and subtitle layout as the final render.
+
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from recap_cache import DiskCache, file_fingerprint
+
+FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+
+PROXY_PARAMS = {'codec': 'libx264', 'preset': 'ultrafast', 'crf': 30, 'audio_codec': 'aac', 'audio_bitrate': '96k'}
+
+
+def make_proxy(input_file, scale, fps, cache, hash_content=False):
+    # Return the path of the proxy for input_file, transcoding it if it is not already cached.
+    key = DiskCache.make_key(file_fingerprint(input_file, hash_content), scale, fps, PROXY_PARAMS)
+    with cache.lock(key):
+        proxy_file = cache.get_file(key, '.mp4')
+        if proxy_file is None:
+            proxy_file = cache.put_file(key, '.mp4', lambda path: transcode(input_file, path, scale, fps))
+    return str(proxy_file)
+
+def transcode(input_file, output_file, scale, fps):
+    # Scale to an even width and height, as required by H.264.
+    cmd = [FFMPEG_BINARY, '-nostdin', '-y', '-v', 'error', '-i', str(input_file),
+           '-vf', f'scale=trunc(iw*{scale}/2)*2:trunc(ih*{scale}/2)*2,fps={fps}',
+           '-c:v', PROXY_PARAMS['codec'], '-preset', PROXY_PARAMS['preset'], '-crf', str(PROXY_PARAMS['crf']),
+           '-c:a', PROXY_PARAMS['audio_codec'], '-b:a', PROXY_PARAMS['audio_bitrate'], str(output_file)]
+    subprocess.run(cmd, check=True)
+
+def make_proxies(video_files, scale, fps, cache, workers=0, hash_content=False):
+    # Make the proxies of several videos in parallel, returning their paths in the same order.
+    # FFmpeg does the work, so threads suffice. Each distinct file is only transcoded once.
+    unique_files = list(dict.fromkeys(video_files))
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        proxy_files = dict(zip(unique_files, executor.map(lambda f: make_proxy(f, scale, fps, cache, hash_content), unique_files)))
+    return [proxy_files[video_file] for video_file in video_files]
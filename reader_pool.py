@@ -0,0 +1,111 @@
+# reader_pool.py - Keeps the number of open FFmpeg readers bounded, however many clips a recap has.
+#
+# Every VideoFileClip holds an FFmpeg process for its frames and another for its audio, along with their pipes and
+# buffers, for as long as the clip exists. A ReaderPool closes the readers of each clip as soon as it is registered,
+# dropping their buffers too, and reopens them on demand, just before a frame or audio chunk is read from them. Once more than max_open readers are
+# open, the least recently used idle reader is closed again, so only the clips currently on screen (or being mixed into
+# the audio track) keep their readers open.
+
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class ReaderPool:
+    # A least recently used pool of open video and audio readers.
+
+    def __init__(self, max_open=4):
+        self.max_open = max_open
+        self._open = OrderedDict()
+        self._busy = {}
+        # The function that closes each managed reader, by id.
+        self._closers = {}
+        self._lock = threading.Lock()
+
+    def register(self, clip):
+        # Close the readers of a freshly opened VideoFileClip and reopen them whenever they are next read from.
+        # Must be called before the clip is cut or copied, so that every copy shares the managed readers.
+        if clip.reader is not None:
+            self._manage(clip.reader, reopen=lambda reader, t: reader.initialize(t), close=lambda reader: reader.close())
+        if clip.audio is not None and getattr(clip.audio, 'reader', None) is not None:
+            self._manage(clip.audio.reader, reopen=reopen_audio, close=close_audio)
+        return clip
+
+    def open_count(self):
+        with self._lock:
+            return len(self._open)
+
+    def close_all(self):
+        with self._lock:
+            for key, reader in self._open.items():
+                self._closers[key](reader)
+            self._open.clear()
+
+    def _manage(self, reader, reopen, close):
+        get_frame = reader.get_frame
+
+        def pooled_get_frame(t):
+            self._acquire(reader, reopen, t)
+            try:
+                return get_frame(t)
+            finally:
+                self._release(reader)
+
+        reader.get_frame = pooled_get_frame
+        self._closers[id(reader)] = close
+        close(reader)
+
+    def _acquire(self, reader, reopen, t):
+        key = id(reader)
+        with self._lock:
+            self._busy[key] = self._busy.get(key, 0) + 1
+            if key in self._open and reader.proc is not None:
+                self._open.move_to_end(key)
+                return
+            self._open.pop(key, None)
+            self._evict(self.max_open - 1)
+            # Count the reader as open before it is, so that other threads make room for it too.
+            self._open[key] = reader
+        # A reader is only ever read from by one thread at a time, so it can be reopened without holding the lock.
+        try:
+            reopen(reader, t)
+        except BaseException:
+            with self._lock:
+                self._open.pop(key, None)
+                self._busy[key] -= 1
+            raise
+
+    def _release(self, reader):
+        with self._lock:
+            self._busy[id(reader)] -= 1
+
+    def _evict(self, limit):
+        # Close the least recently used readers that are not being read from until at most limit remain open.
+        # Readers that are in use are never closed, so the limit may be exceeded while they are all busy.
+        for key in list(self._open):
+            if len(self._open) <= limit:
+                break
+            if not self._busy.get(key):
+                self._closers[key](self._open.pop(key))
+
+
+def close_audio(reader):
+    # FFMPEG_AudioReader.close() keeps the decoded buffer, which holds a few megabytes of audio, so it is dropped too.
+    reader.close()
+    reader.buffer = None
+    reader.buffer_startframe = 1
+
+def reopen_audio(reader, t):
+    # Reopen an audio reader whose buffer was dropped, refilling the buffer around the first frame that get_frame(t)
+    # reads, just as get_frame() itself would when t lies outside the buffer.
+    if isinstance(t, np.ndarray):
+        frames = np.round(reader.fps * t).astype(int)[(t >= 0) & (t < reader.duration)]
+        frame = int(frames.min()) if len(frames) else 0
+    else:
+        frame = int(reader.fps * t)
+    # initialize() leaves the position as a NumPy float, which a later forward seek cannot skip by, so it is set back
+    # to a whole frame number.
+    start = max(0, frame - reader.buffersize // 2)
+    reader.initialize(start / reader.fps)
+    reader.pos = start
+    reader.buffer_around(frame)
@@ -0,0 +1,169 @@
+# recap_cache.py - Persistent, size-bounded on-disk cache for expensive analysis results.
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+
+
+def file_fingerprint(path, hash_content=False):
+    # Identify a file by a hash of its content or, more cheaply, by its name, size and modification time.
+    stat = os.stat(path)
+    if not hash_content:
+        return f'stat:{Path(path).name}:{stat.st_size}:{stat.st_mtime_ns}'
+
+    memo_key = (os.path.realpath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _content_hashes:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        _content_hashes[memo_key] = f'sha256:{digest.hexdigest()}'
+    return _content_hashes[memo_key]
+
+# Content hashes computed during this process, so that large files are only read once per run.
+_content_hashes = {}
+
+# Serialises writes and evictions by threads sharing a cache directory.
+_write_lock = threading.Lock()
+
+# Locks of the entries being computed by threads of this process, by cache directory and key.
+_entry_locks = {}
+_entry_locks_lock = threading.Lock()
+
+
+class DiskCache:
+    # A directory of JSON entries (or NumPy arrays, or arbitrary files) addressed by a hash of their key.
+    # When the total size exceeds max_size_mb, the least recently used entries are evicted.
+
+    def __init__(self, cache_dir, namespace, max_size_mb=None):
+        self.namespace = namespace
+        self.path = Path(cache_dir, namespace)
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024) if max_size_mb else None
+
+    @staticmethod
+    def make_key(*parts):
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def lock(self, key):
+        # A lock shared by every thread of this process that computes the entry for key. Holding it while checking
+        # for the entry and computing it means that recaps rendered side by side in batch mode compute it only once.
+        with _entry_locks_lock:
+            return _entry_locks.setdefault((str(self.path), key), threading.Lock())
+
+    def get(self, key, default=None):
+        entry_file = self.path / f'{key}.json'
+        try:
+            with open(entry_file, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return default
+        # Refresh the modification time so that eviction is least recently used.
+        try:
+            os.utime(entry_file)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        with _write_lock:
+            self.path.mkdir(parents=True, exist_ok=True)
+            entry_file = self.path / f'{key}.json'
+            tmp_file = self.path / f'{key}.{os.getpid()}.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(value, f)
+            os.replace(tmp_file, entry_file)
+            self.evict()
+
+    def get_arrays(self, key):
+        # Return the dict of NumPy arrays stored under key, or None if there is no such entry.
+        import numpy as np
+        entry_file = self.path / f'{key}.npz'
+        try:
+            with np.load(entry_file) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        try:
+            os.utime(entry_file)
+        except OSError:
+            pass
+        return arrays
+
+    def put_arrays(self, key, **arrays):
+        # Arrays are stored compressed, as the ones cached so far (such as subtitle sprites) are mostly empty.
+        import numpy as np
+        with _write_lock:
+            self.path.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.path / f'{key}.{os.getpid()}.tmp.npz'
+            np.savez_compressed(tmp_file, **arrays)
+            os.replace(tmp_file, self.path / f'{key}.npz')
+            self.evict()
+
+    def get_file(self, key, suffix):
+        # Return the path of the file entry stored under key, or None if there is no such entry.
+        entry_file = self.path / f'{key}{suffix}'
+        if not entry_file.exists():
+            return None
+        try:
+            os.utime(entry_file)
+        except OSError:
+            pass
+        return entry_file
+
+    def put_file(self, key, suffix, write):
+        # Store a file entry under key. write(path) is called to create the file at a temporary path first.
+        self.path.mkdir(parents=True, exist_ok=True)
+        entry_file = self.path / f'{key}{suffix}'
+        tmp_file = self.path / f'{key}.{os.getpid()}.{threading.get_ident()}.tmp{suffix}'
+        try:
+            write(tmp_file)
+        except BaseException:
+            tmp_file.unlink(missing_ok=True)
+            raise
+        with _write_lock:
+            os.replace(tmp_file, entry_file)
+            self.evict(keep=entry_file)
+        return entry_file
+
+    def entries(self):
+        # Yield (key, value) for every JSON entry, most recently used first.
+        json_files = [f for f in self._entry_files() if f.suffix == '.json']
+        for entry_file in sorted(json_files, key=lambda f: f.stat().st_mtime, reverse=True):
+            try:
+                with open(entry_file, 'r', encoding='utf-8') as f:
+                    yield entry_file.stem, json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+
+    def evict(self, keep=None):
+        # keep is an entry that must not be evicted, e.g. one that has just been written and is about to be used.
+        if self.max_size_bytes is None:
+            return
+        files = [(f, f.stat()) for f in self._entry_files() if f != keep]
+        total = sum(stat.st_size for _, stat in files) + (keep.stat().st_size if keep is not None and keep.exists() else 0)
+        for entry_file, stat in sorted(files, key=lambda item: item[1].st_mtime):
+            if total <= self.max_size_bytes:
+                break
+            entry_file.unlink(missing_ok=True)
+            total -= stat.st_size
+
+    def info(self):
+        files = list(self._entry_files())
+        return {'namespace': self.namespace,
+                'path': str(self.path),
+                'entries': len(files),
+                'size_bytes': sum(f.stat().st_size for f in files),
+                'max_size_bytes': self.max_size_bytes}
+
+    def clear(self):
+        if self.path.exists():
+            shutil.rmtree(self.path)
+
+    def _entry_files(self):
+        if not self.path.exists():
+            return []
+        return [f for f in self.path.iterdir() if f.is_file() and '.tmp' not in f.suffixes]
+
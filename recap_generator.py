@@ -1,19 +1,33 @@
 #!/usr/bin/env python3
 # recap_generator.py - Extracts clips from video files and combines them into a single recap video.
 
-import openpyxl
+# MoviePy and pychorus take a while to import, so they are imported where they are first used. This keeps --plan and
+# the cache commands quick to start.
 from pathlib import Path
-from moviepy import VideoFileClip, CompositeVideoClip, ImageClip, TextClip
-import moviepy.audio.fx as afx
-import moviepy.video.fx as vfx
-from moviepy.video.tools.subtitles import SubtitlesClip
-from pychorus import find_and_output_chorus
 from typing import Literal
 import jsonschema
 import ruamel.yaml as ry
 from input.default import default_schema
-import os, sys
+from recap_cache import DiskCache, file_fingerprint
+import chorus_detector
+from letterbox import CANVAS_SIZE, letterbox, load_static_layer
+from subtitles import render_text, subtitle_track
+from loudness import clip_gains
+from proxies import make_proxies
+from profiling import NULL_PROFILER, StageProfiler
+from frame_pipeline import pipelined
+from reader_pool import ReaderPool
+from video_data import read_video_data
+from planning import check_files, check_rows, format_time, probe_all, timeline
+from segments import clip_offsets, concat_segments, plan_segments, read_manifest, segment_hashes, subtitle_windows, write_manifest
+from functools import partial
+import argparse
+import importlib.metadata
+import os, sys, shutil, tempfile
 from audioread.exceptions import NoBackendError
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+import multiprocessing
 import warnings
 
 warnings.filterwarnings('ignore')
@@ -21,8 +35,11 @@ warnings.filterwarnings('ignore')
 
 fschema = os.path.join(os.path.dirname(os.path.realpath(__file__)), "input/schema.yaml")
 
+# The length in seconds of the crossfade between consecutive clips.
+CUSTOM_PADDING = 1
 
-def generate_recap(# The path to the video data spreadsheet. Must be an XLSX file.
+
+def generate_recap(# The path to the video data spreadsheet. Must be an XLSX file, or a CSV file with the same columns.
                    video_data_file: str = 'video_data.xlsx',
                    # The path to the directory containing the video files to be used for the recap.
                    video_directory: str = 'Videos',
@@ -63,197 +80,530 @@ def generate_recap(# The path to the video data spreadsheet. Must be an XLSX fil
                    # The colour to be used for the intro text outline. Accepts colour names or hex values.
                    intro_stroke_color: str = 'black',
                    # The thickness of the intro text outline.
-                   intro_stroke_width: int = 3
+                   intro_stroke_width: int = 3,
+                   # The chorus detection engine. 'streaming' decodes audio in chunks and keeps memory use within chorus_memory_budget_mb, which suits long videos.
+                   chorus_detector: Literal['pychorus', 'streaming'] = 'pychorus',
+                   # The memory budget in megabytes for the repeated section search of the streaming chorus detector.
+                   chorus_memory_budget_mb: float = 256,
+                   # The number of worker processes used for chorus detection. Set to 0 to use all available CPU cores.
+                   chorus_workers: int = 1,
+                   # If True, chorus detection results are cached on disk and reused on later runs.
+                   use_chorus_cache: bool = True,
+                   # If True, cached results are keyed by a hash of the video file contents rather than its name, size and modification time.
+                   chorus_cache_hash_content: bool = False,
+                   # The directory in which cached results are stored.
+                   cache_directory: str = '.recap_cache',
+                   # The maximum size of each cache in megabytes. The least recently used entries are evicted beyond this size.
+                   cache_max_size_mb: float = 64,
+                   # The maximum size in megabytes of the cache of rendered subtitle text, which is kept separately as its images are larger than the other cached results.
+                   text_cache_max_size_mb: float = 256,
+                   # 'segmented' encodes each clip and crossfade as a separate segment in parallel worker processes, then joins them without re-encoding.
+                   # 'draft' renders a quick low-resolution preview from cached proxies of the videos, saved next to the output file with .draft added to its name.
+                   render_mode: Literal['standard', 'segmented', 'draft'] = 'standard',
+                   # The number of worker processes used in the segmented render mode. Set to 0 to use all available CPU cores.
+                   render_workers: int = 0,
+                   # If True, the segmented render mode keeps its segments and a manifest next to the output file, and only re-renders segments that have changed.
+                   incremental_render: bool = True,
+                   # How clip audio is normalised. 'peak' scales each clip so that its loudest sample is at full volume. 'loudness' brings each clip to loudness_target, for more consistent levels between clips.
+                   audio_normalization: Literal['peak', 'loudness'] = 'peak',
+                   # The integrated loudness in LUFS that clips are brought to when audio_normalization is 'loudness'.
+                   loudness_target: float = -16,
+                   # The number of clips whose audio levels are measured at once. Each measurement runs in an FFmpeg process of its own. Set to 0 to use all available CPU cores.
+                   loudness_workers: int = 0,
+                   # The scale of the draft render mode's video relative to 1920x1080, e.g. 0.25 renders at 480x270.
+                   draft_scale: float = 0.25,
+                   # The frame rate of the draft render mode.
+                   draft_fps: float = 12,
+                   # The number of videos transcoded into proxies at once in the draft render mode. FFmpeg already uses several threads for each video. Set to 0 to transcode one video per CPU core.
+                   proxy_workers: int = 2,
+                   # The maximum size in megabytes of the cache of low-resolution proxy videos used by the draft render mode.
+                   proxy_cache_max_size_mb: float = 2048,
+                   # The path of a JSON report of the time, CPU and memory used by each stage, and of per-frame render timings. Leave empty to disable profiling.
+                   profile_report: str = '',
+                   # The number of threads that render frames ahead of the encoder in the standard and draft render modes. 1 renders one frame at a time. Set to 0 to use all available CPU cores.
+                   pipeline_workers: int = 1,
+                   # The maximum number of frames rendered ahead of the encoder. Higher values can keep more threads busy but use more memory.
+                   frame_queue_size: int = 16,
+                   # The maximum number of video and audio readers kept open at once. Readers are reopened when their clip is next needed. Set to 0 to keep every reader open.
+                   max_open_readers: int = 4,
+                   # The name of the worksheet in the video data spreadsheet to read. Leave empty to read the active worksheet. Not used for CSV files.
+                   worksheet: str = '',
+                   # Whether to wait for Enter to be pressed before exiting when clips cannot be selected. Batch mode turns this off.
+                   interactive: bool = True
                    ) -> None:
-    wb = openpyxl.load_workbook(video_data_file)
-    ws = wb.active
-
-    print('Importing data from spreadsheet...')
-    ids, id_cells = get_video_filenames(ws)
+    profiler = StageProfiler() if profile_report else NULL_PROFILER
 
-    print('Extracting clips...')
-    video_clips = extract_clips(ws, ids, id_cells, clip_selection_method, clip_length, video_directory)
+    # A failed recap must not leave readers open or the memory sampler running, as batch mode carries on with other recaps.
+    reader_pool = None
+    try:
+        print('Importing data from spreadsheet...')
+        with profiler.stage('get_video_filenames'):
+            rows = read_video_data(video_data_file, worksheet)
+            ids = [row['id'] for row in rows]
+
+        print('Extracting clips...')
+        caches = open_caches(cache_directory, cache_max_size_mb, proxy_cache_max_size_mb, text_cache_max_size_mb)
+        with profiler.stage('select_clips'):
+            clip_ranges = select_clips(rows, clip_selection_method, clip_length, video_directory, chorus_workers,
+                                       caches['chorus'] if use_chorus_cache else None, chorus_cache_hash_content,
+                                       chorus_detector, chorus_memory_budget_mb, interactive)
+        video_files = [str(Path(video_directory, f'{video_id}')) for video_id in ids]
+        print('Analysing audio levels...')
+        with profiler.stage('clip_gains'):
+            gains = clip_gains(video_files, clip_ranges, audio_normalization, loudness_target,
+                               loudness_workers, caches['loudness'], chorus_cache_hash_content)
+        # Chorus detection and audio analysis always use the original videos, so a draft has the same timing as the final render.
+        canvas_size = CANVAS_SIZE
+        if render_mode == 'draft':
+            print('Preparing low-resolution proxies...')
+            with profiler.stage('make_proxies'):
+                video_files = make_proxies(video_files, draft_scale, draft_fps, caches['proxies'], proxy_workers, chorus_cache_hash_content)
+            canvas_size = draft_canvas_size(draft_scale)
+        if max_open_readers:
+            reader_pool = ReaderPool(max_open_readers)
+        with profiler.stage('extract_clips'):
+            video_clips = extract_clips(video_files, clip_ranges, gains, profiler=profiler, reader_pool=reader_pool,
+                                        video_names=[Path(video_directory, f'{video_id}').name for video_id in ids])
+
+        custom_padding = CUSTOM_PADDING
+        render_options = dict(include_intro=include_intro, use_overlay_intro_image=use_overlay_intro_image, intro_image_file=intro_image_file,
+                              intro_image_duration=intro_image_duration, make_intro_image_fullscreen=make_intro_image_fullscreen,
+                              sub_alignment=sub_alignment, sub_font_file=sub_font_file, sub_font_size=sub_font_size, sub_text_color=sub_text_color,
+                              sub_stroke_color=sub_stroke_color, sub_stroke_width=sub_stroke_width,
+                              intro_font_file=intro_font_file, intro_font_size=intro_font_size, intro_text_color=intro_text_color,
+                              intro_stroke_color=intro_stroke_color, intro_stroke_width=intro_stroke_width)
+        recap, durations = build_recap(rows, video_clips, custom_padding, caches['text'], canvas_size=canvas_size, profiler=profiler, **render_options)
+
+        # Save recap video file.
+        print('Saving recap...')
+        # Drafts are written at a lower frame rate than the videos.
+        fps = draft_fps if render_mode == 'draft' else recap.fps
+        if render_mode == 'segmented':
+            clip_descriptors = [{'source': file_fingerprint(Path(video_directory, f'{ids[i]}')),
+                                 'range': [str(t) for t in clip_ranges[i]],
+                                 'subtitle': rows[i]['subtitle']}
+                                for i in range(len(ids))]
+            # Frames are rendered by the worker processes, so only the stage as a whole is timed.
+            with profiler.stage('write'):
+                render_segmented(recap, durations, output_file, custom_padding, render_workers,
+                                 (rows, clip_ranges, video_directory, custom_padding, caches['text'], max_open_readers, render_options),
+                                 clip_descriptors if incremental_render else None)
+        else:
+            written_file = draft_output_file(output_file) if render_mode == 'draft' else output_file
+            # MoviePy names its temporary audio file after the output file and puts it in the working directory, so recaps
+            # rendered side by side in batch mode would share one. Each recap gets a directory of its own for it instead.
+            audio_dir = tempfile.mkdtemp(prefix='recap_audio_', dir=Path(written_file).resolve().parent)
+            try:
+                with profiler.stage('write'), pipelined(recap, fps, pipeline_workers or os.cpu_count() or 1, frame_queue_size), \
+                        profiler.instrument_frames(recap, video_clips):
+                    if render_mode == 'draft':
+                        recap.write_videofile(written_file, fps=fps, preset='ultrafast', temp_audiofile_path=audio_dir)
+                    else:
+                        recap.write_videofile(written_file, temp_audiofile_path=audio_dir)
+            finally:
+                shutil.rmtree(audio_dir, ignore_errors=True)
+
+        if profile_report:
+            profiler.write_report(profile_report, render_mode=render_mode, clips=len(video_clips), duration_s=recap.duration, fps=fps)
+            print(f'Profiling report saved to {profile_report}')
+    finally:
+        if reader_pool:
+            reader_pool.close_all()
+        profiler.close()
+
+def build_recap(rows, video_clips, custom_padding, text_cache, include_intro, use_overlay_intro_image, intro_image_file, intro_image_duration,
+                make_intro_image_fullscreen, sub_alignment, sub_font_file, sub_font_size, sub_text_color, sub_stroke_color, sub_stroke_width,
+                intro_font_file, intro_font_size, intro_text_color, intro_stroke_color, intro_stroke_width, canvas_size=CANVAS_SIZE, profiler=NULL_PROFILER,
+                verbose=True):
+    # Combine the extracted clips into the final recap, with resizing, crossfades and subtitles.
+    # Returns the recap and the length of each clip in it, which is longer than the extracted clip for an intro clip
+    # that is shorter than intro_image_duration.
+    from timeline import TimelineClip
+    log = print if verbose else lambda *args: None
 
     if use_overlay_intro_image:
         start_clip_idx = 1
     else:
         start_clip_idx = 0
     
-    print('Resizing clips...')
-    resized_clips = resize_clips(video_clips, start_clip_idx, intro_image_duration, make_intro_image_fullscreen, intro_image_file)
-
-    print('Adding crossfade to clips...')
-    custom_padding = 1
-    faded_clips = add_crossfade(resized_clips, custom_padding)
+    log('Resizing clips...')
+    with profiler.stage('resize_clips'):
+        resized_clips = resize_clips(video_clips, start_clip_idx, intro_image_duration, make_intro_image_fullscreen, intro_image_file, canvas_size)
+    durations = [clip.duration for clip in resized_clips]
+
+    log('Adding crossfade to clips...')
+    with profiler.stage('add_crossfade'):
+        faded_clips = add_crossfade(resized_clips, custom_padding)
     
-    print('Concatenating clips...')
-    video = CompositeVideoClip(faded_clips)
-
-    print('Generating subtitles...')
-    subtitles, start_sub_idx = generate_subtitles(ws, id_cells, video_clips, custom_padding, include_intro, 
-                                                  sub_font_file, sub_font_size, sub_text_color, sub_stroke_color, sub_stroke_width,
-                                                  intro_font_file, intro_font_size, intro_text_color, intro_stroke_color, intro_stroke_width)
+    log('Generating subtitles...')
+    with profiler.stage('generate_subtitles'):
+        subtitles, start_sub_idx = generate_subtitles(rows, durations, custom_padding, include_intro, 
+                                                      sub_font_file, sub_font_size, sub_text_color, sub_stroke_color, sub_stroke_width,
+                                                      intro_font_file, intro_font_size, intro_text_color, intro_stroke_color, intro_stroke_width, text_cache,
+                                                      canvas_size[1] / CANVAS_SIZE[1])
 
     # Align subtitles according to user input.
-    print('Adding subtitles...')
-    recap = CompositeVideoClip([video] + 
-                               [sub.with_position(('center','center')) for sub in subtitles[:start_sub_idx]] +    # Align intro text in centre
-                               [sub.with_position((f'{sub_alignment}','bottom')) for sub in subtitles[start_sub_idx:]])
-
-    # Save recap video file.
-    print('Saving recap...')
-    recap.write_videofile(output_file)
-
-def get_video_filenames(ws):
-    # Get video filenames from spreadsheet.
-    id_cells = [cell for cell in ws['A'] if cell.value != 'FILENAME' and cell.value != None and cell.value != '']
-    ids = [str(cell.value) for cell in ws['A'] if cell.value != 'FILENAME' and cell.value != None and cell.value != '']
-    return ids, id_cells
-
-def extract_clips(ws, ids, id_cells, clip_selection_method, clip_length, video_dir):
+    # The clips and subtitles are composited in a single timeline so that each frame only evaluates the layers playing at that time.
+    log('Concatenating clips and adding subtitles...')
+    with profiler.stage('build_timeline'):
+        recap = TimelineClip(faded_clips + 
+                             [sub.with_position(('center','center')) for sub in subtitles[:start_sub_idx]] +    # Align intro text in centre
+                             [sub.with_position((f'{sub_alignment}','bottom')) for sub in subtitles[start_sub_idx:]])
+
+    return recap, durations
+
+def select_clips(rows, clip_selection_method, clip_length, video_dir, chorus_workers=1, cache=None, hash_content=False,
+                 detector='pychorus', memory_budget_mb=256, interactive=True):
+    # Work out the (start, end) times of the clip to take from each row of the spreadsheet.
     if clip_selection_method == 'manual':
-        # Pick out the specified clips from the files and normalise their audio.
-        video_clips = []
-        for i in range(len(ids)):
-            video_clips.append(VideoFileClip(str(Path(video_dir, f'{ids[i]}'))).subclipped(str(ws[f'B{id_cells[i].row}'].value), str(ws[f'C{id_cells[i].row}'].value)).with_effects([afx.AudioNormalize()]))
+        # Pick out the specified clips from the files.
+        clip_ranges = []
+        for row in rows:
+            clip_ranges.append((str(row['start']), str(row['end'])))
     elif clip_selection_method == 'auto':
+        # Detect choruses up front for every row without a manually specified clip.
+        auto_idxs = [i for i in range(len(rows)) if not (rows[i]['start'] and rows[i]['end'])]
+        chorus_starts = dict(zip(auto_idxs, detect_choruses([str(Path(video_dir, f"{rows[i]['id']}")) for i in auto_idxs], clip_length, chorus_workers, cache, hash_content,
+                                                                  detector, memory_budget_mb)))
+
         chorus_error = False
         missing_choruses = []
-        video_clips = []
-        for i in range(len(ids)):
-            print(f'Extracting clip {i+1} of {len(ids)}')
+        clip_ranges = []
+        for i in range(len(rows)):
             # Use manual clip if it is specified in spreadsheet.
-            if ws[f'B{id_cells[i].row}'].value and ws[f'C{id_cells[i].row}'].value:
-                video_clips.append(VideoFileClip(str(Path(video_dir, f'{ids[i]}'))).subclipped(str(ws[f'B{id_cells[i].row}'].value), str(ws[f'C{id_cells[i].row}'].value)).with_effects([afx.AudioNormalize()]))
+            if i not in chorus_starts:
+                clip_ranges.append((str(rows[i]['start']), str(rows[i]['end'])))
             # Otherwise select clip automatically via chorus detection.
+            elif chorus_starts[i] is not None:
+                clip_ranges.append((chorus_starts[i], chorus_starts[i] + clip_length))
             else:
-                chorus_start = find_and_output_chorus(str(Path(video_dir, f'{ids[i]}')), None)
-                try:
-                    video_clips.append(VideoFileClip(str(Path(video_dir, f'{ids[i]}'))).subclipped(chorus_start, chorus_start + clip_length).with_effects([afx.AudioNormalize()]))
-                except TypeError:
-                    chorus_error = True
-                    print(f'No chorus found for video {ids[i]}. Please choose a clip manually.')
-                    missing_choruses.append(ids[i])
+                chorus_error = True
+                print(f"No chorus found for video {rows[i]['id']}. Please choose a clip manually.")
+                missing_choruses.append(rows[i]['id'])
         if chorus_error:
             print(f'Auto-generation failed for some clips. Please choose clips manually for the videos specified below then try again.\n{missing_choruses}')
-            input('Press Enter to exit.')
-            raise TypeError('Auto-generation failed for some clips.')
+            if interactive:
+                input('Press Enter to exit.')
+            raise TypeError(f'Auto-generation failed for some clips: {missing_choruses}')
+    
+    return clip_ranges
+
+def extract_clips(video_files, clip_ranges, gains=None, verbose=True, profiler=NULL_PROFILER, reader_pool=None, video_names=None):
+    # Cut the selected clips from the video files and normalise their audio by applying the precomputed gains.
+    # If a reader pool is given, the clips' readers are closed until they are needed, to bound the number of open files.
+    # video_names label the clips in the profiling report, e.g. with the original videos when the files are proxies.
+    from moviepy import VideoFileClip
+    import moviepy.audio.fx as afx
+    video_clips = []
+    for i in range(len(video_files)):
+        if verbose:
+            print(f'Extracting clip {i+1} of {len(video_files)}')
+        with profiler.stage('extract_clip', video=video_names[i] if video_names else Path(video_files[i]).name):
+            clip = VideoFileClip(video_files[i])
+            if reader_pool:
+                reader_pool.register(clip)
+            clip = clip.subclipped(*clip_ranges[i])
+        video_clips.append(clip.with_effects([afx.MultiplyVolume(gains[i])]) if gains and gains[i] != 1 else clip)
     
     return video_clips
 
-def resize_clips(video_clips, start_clip_idx, intro_image_duration, fullscreen_intro_image, intro_image_file):
-    # Resize clips while maintaining aspect ratio and then add black borders if necessary to reach 1920x1080p.
+def detect_choruses(video_files, clip_length, chorus_workers=1, cache=None, hash_content=False, detector='pychorus', memory_budget_mb=256):
+    # Find the chorus start time of each video file, returning the results in the same order as the input.
+    # A result of None means that no chorus was found. Cached results are reused and only cache misses are analysed.
+    keys = [chorus_cache_key(video_file, clip_length, detector, hash_content) for video_file in video_files] if cache else [None] * len(video_files)
+    with ExitStack() as locks:
+        if cache:
+            # Recaps rendered in the same batch may be analysing some of the same videos. Their results are waited for
+            # and reused. The locks are always taken in the same order so that two recaps never wait for each other.
+            for key in sorted(set(keys)):
+                locks.enter_context(cache.lock(key))
+        results = [cache.get(key) if cache else None for key in keys]
+        pending = [i for i in range(len(video_files)) if results[i] is None]
+        if cache and len(pending) < len(video_files):
+            print(f'Reusing cached chorus detection results for {len(video_files) - len(pending)} of {len(video_files)} videos.')
+
+        find = partial(find_chorus, detector=detector, clip_length=clip_length, memory_budget_mb=memory_budget_mb)
+        workers = chorus_workers or os.cpu_count() or 1
+        if workers == 1 or len(pending) <= 1:
+            chorus_starts = [find(video_files[i]) for i in pending]
+        else:
+            print(f'Detecting choruses in {len(pending)} videos using {min(workers, len(pending))} worker processes...')
+            # Worker processes are started fresh rather than forked, as forking copies the state of any other threads.
+            with ProcessPoolExecutor(max_workers=min(workers, len(pending)), mp_context=multiprocessing.get_context('spawn')) as executor:
+                chorus_starts = list(executor.map(find, [video_files[i] for i in pending]))
+
+        for i, chorus_start in zip(pending, chorus_starts):
+            results[i] = {'source': Path(video_files[i]).name,
+                          'chorus_start': None if chorus_start is None else float(chorus_start)}
+            if cache:
+                cache.put(keys[i], results[i])
+
+    return [result['chorus_start'] for result in results]
+
+def find_chorus(video_file, detector='pychorus', clip_length=15, memory_budget_mb=256):
+    # Module-level wrapper so that chorus detection can be dispatched to worker processes.
+    if detector == 'streaming':
+        return chorus_detector.find_chorus(video_file, clip_length, memory_budget_mb)
+    from pychorus import find_and_output_chorus
+    return find_and_output_chorus(video_file, None)
+
+def open_caches(cache_directory, cache_max_size_mb, proxy_cache_max_size_mb=2048, text_cache_max_size_mb=256):
+    # The on-disk caches used by the generator, by namespace: chorus start times, audio levels, rendered subtitle text
+    # and the proxy videos of the draft render mode. The last two have separate size limits as their entries are larger.
+    caches = {namespace: DiskCache(cache_directory, namespace, cache_max_size_mb) for namespace in ['chorus', 'loudness']}
+    caches['text'] = DiskCache(cache_directory, 'text', text_cache_max_size_mb)
+    caches['proxies'] = DiskCache(cache_directory, 'proxies', proxy_cache_max_size_mb)
+    return caches
+
+def draft_canvas_size(draft_scale):
+    # Scale the 1920x1080 canvas, rounding to even dimensions as required by H.264.
+    return tuple(max(2, 2 * round(dimension * draft_scale / 2)) for dimension in CANVAS_SIZE)
+
+def draft_output_file(output_file):
+    # recap.mp4 becomes recap.draft.mp4.
+    output_file = Path(output_file)
+    return str(output_file.with_name(f'{output_file.stem}.draft{output_file.suffix}'))
+
+def chorus_cache_key(video_file, clip_length, detector='pychorus', hash_content=False):
+    # The key covers the video content, the clip length and the detector along with its parameters.
+    return DiskCache.make_key(file_fingerprint(video_file, hash_content), clip_length, chorus_detector_params(detector))
+
+def chorus_detector_params(detector='pychorus'):
+    if detector == 'streaming':
+        return chorus_detector.DETECTOR_PARAMS
+    # pychorus is run with its default parameters, so its version stands in for them.
+    try:
+        version = importlib.metadata.version('pychorus')
+    except importlib.metadata.PackageNotFoundError:
+        version = None
+    return {'detector': 'pychorus', 'version': version}
+
+def print_cache_info(cache):
+    info = cache.info()
+    limit = f"{info['max_size_bytes'] / 1024 / 1024:.1f} MB" if info['max_size_bytes'] else 'unlimited'
+    print(f"Cache '{info['namespace']}' at {info['path']}: {info['entries']} entries, {info['size_bytes'] / 1024:.1f} KB (limit {limit})")
+    for key, value in cache.entries():
+        print(f"  {key[:12]}  {value}")
+
+def resize_clips(video_clips, start_clip_idx, intro_image_duration, fullscreen_intro_image, intro_image_file, canvas_size=CANVAS_SIZE):
+    # Resize clips while maintaining aspect ratio and then add black borders if necessary to reach the canvas size (1920x1080p unless drafting).
     # Also add intro image overlay.
+    # The black background and the intro image are decoded and resized once, then drawn into each clip's canvas buffer.
     resized_clips = []
 
     for clip in video_clips[:start_clip_idx]:
-        img_clip = ImageClip(intro_image_file, duration=intro_image_duration)
+        img_rgb, _ = load_static_layer(intro_image_file)
         if fullscreen_intro_image:
             img_size_ratio = 1.0
         else:
             img_size_ratio = 0.5
         
-        if clip.w / clip.h <= 1920 / 1080 and img_clip.w / img_clip.h <= 1920 / 1080:
-            resized_clips.append(CompositeVideoClip([ImageClip('1920x1080-black.jpg', duration=clip.duration).resized((1920, 1080)), 
-                                                clip.resized(height=1080).with_position('center', 'center'),
-                                                img_clip.resized(height=round(1080*img_size_ratio)).with_position('center', 'center')]))
-        elif clip.w / clip.h > 1920 / 1080 and img_clip.w / img_clip.h <= 1920 / 1080:
-            resized_clips.append(CompositeVideoClip([ImageClip('1920x1080-black.jpg', duration=clip.duration).resized((1920, 1080)), 
-                                                clip.resized(width=1920).with_position('center', 'center'),
-                                                img_clip.resized(height=round(1080*img_size_ratio)).with_position('center', 'center')])) 
-        elif clip.w / clip.h <= 1920 / 1080 and img_clip.w / img_clip.h > 1920 / 1080:
-            resized_clips.append(CompositeVideoClip([ImageClip('1920x1080-black.jpg', duration=clip.duration).resized((1920, 1080)), 
-                                                clip.resized(height=1080).with_position('center', 'center'),
-                                                img_clip.resized(width=round(1920*img_size_ratio)).with_position('center', 'center')])) 
-        else: 
-            resized_clips.append(CompositeVideoClip([ImageClip('1920x1080-black.jpg', duration=clip.duration), 
-                                              clip.resized(width=1920).with_position('center', 'center'),
-                                              img_clip.resized(width=round(1920*img_size_ratio)).with_position('center', 'center')]))
-
-    resized_clips += [CompositeVideoClip([ImageClip('1920x1080-black.jpg', duration=clip.duration).resized((1920, 1080)), 
-                                         clip.resized(height=1080).with_position('center', 'center')]) 
-                      if clip.w / clip.h <= 1920 / 1080 
-                      else CompositeVideoClip([ImageClip('1920x1080-black.jpg', duration=clip.duration), 
-                                               clip.resized(width=1920).with_position('center', 'center')]) 
-                      for clip in video_clips[start_clip_idx:]
-                     ]
+        canvas_w, canvas_h = canvas_size
+        if img_rgb.shape[1] / img_rgb.shape[0] <= canvas_w / canvas_h:
+            overlay = load_static_layer(intro_image_file, height=round(canvas_h*img_size_ratio))
+        else:
+            overlay = load_static_layer(intro_image_file, width=round(canvas_w*img_size_ratio))
+        resized_clips.append(letterbox(clip, '1920x1080-black.jpg', canvas_size, overlay=overlay, overlay_duration=intro_image_duration))
+
+    resized_clips += [letterbox(clip, '1920x1080-black.jpg', canvas_size) for clip in video_clips[start_clip_idx:]]
     
     return resized_clips
 
 def add_crossfade(resized_clips, custom_padding):
     # Add crossfade to clips.
+    import moviepy.audio.fx as afx
+    import moviepy.video.fx as vfx
     faded_clips = [resized_clips[0].with_effects([afx.AudioFadeIn(custom_padding), afx.AudioFadeOut(custom_padding), vfx.FadeIn(custom_padding)])]
-    idx = resized_clips[0].duration - custom_padding
+    offsets = clip_offsets([clip.duration for clip in resized_clips], custom_padding)
     for i in range(len(resized_clips[1:])):
         clip = resized_clips[i+1].with_effects([afx.AudioFadeIn(custom_padding), afx.AudioFadeOut(custom_padding)])
-        faded_clips.append(clip.with_start(idx).with_effects([vfx.CrossFadeIn(custom_padding)]))
-        idx += clip.duration - custom_padding
+        faded_clips.append(clip.with_start(offsets[i+1]).with_effects([vfx.CrossFadeIn(custom_padding)]))
     # Fade the final clip out to black.
     faded_clips[-1] = faded_clips[-1].with_effects([vfx.FadeOut(custom_padding)])
 
     return faded_clips
 
-def generate_subtitles(ws, id_cells, video_clips, custom_padding, include_intro, 
+def generate_subtitles(rows, durations, custom_padding, include_intro, 
                        sub_font_file, sub_font_size, sub_text_color, sub_stroke_color, sub_stroke_width,
-                       intro_font_file, intro_font_size, intro_text_color, intro_stroke_color, intro_stroke_width):
+                       intro_font_file, intro_font_size, intro_text_color, intro_stroke_color, intro_stroke_width, text_cache=None, scale=1.0):
+    # durations are the lengths of the clips in the recap. scale shrinks the text along with the canvas in the draft render mode.
     subtitles = []
     start_clip_idx = 0
     start_sub_idx = 0
+    # Work out the start and end time of every subtitle in one pass over the clip durations.
+    windows = subtitle_windows(durations, custom_padding, include_intro)
 
     if include_intro:
         start_clip_idx = 1
        
-        generator = lambda txt: TextClip(text=txt, 
-                                         font=intro_font_file, 
-                                         font_size=intro_font_size, 
-                                         color=intro_text_color, 
-                                         stroke_color=intro_stroke_color, 
-                                         stroke_width=intro_stroke_width)
-
-        intro_txt = ''
-        if ws[f'D{id_cells[0].row}'].value:
-            intro_txt += str(ws[f'D{id_cells[0].row}'].value)
-        if ws[f'E{id_cells[0].row}'].value:
-            intro_txt += '\n' + str(ws[f'E{id_cells[0].row}'].value)
-        if ws[f'F{id_cells[0].row}'].value:
-            intro_txt += '\n' + str(ws[f'F{id_cells[0].row}'].value)
-        
-        intro_sub = [
-                    ((custom_padding, # Start time of subtitle
-                    int(video_clips[0].duration - custom_padding)), # End time of subtitle
-                    intro_txt) # Text of subtitle
-                    ]
-        subtitles.append(SubtitlesClip(intro_sub, make_textclip=generator, encoding='utf-8'))
+        generator = partial(render_text,
+                            font=intro_font_file, 
+                            font_size=scale_size(intro_font_size, scale), 
+                            color=intro_text_color, 
+                            stroke_color=intro_stroke_color, 
+                            stroke_width=scale_size(intro_stroke_width, scale),
+                            cache=text_cache)
 
-        start_sub_idx = len(subtitles)
+        intro_sub = [(windows[0], rows[0]['subtitle'])]
+        subtitles.append(subtitle_track(intro_sub, generator))
 
-    generator = lambda txt: TextClip(text=txt, 
-                                     font=sub_font_file, 
-                                     font_size=sub_font_size, 
-                                     color=sub_text_color, 
-                                     stroke_color=sub_stroke_color, 
-                                     stroke_width=sub_stroke_width, 
-                                     margin=(10,20))
-    subs = []
-    for clip in video_clips[start_clip_idx:]:
-        sub_txt = ''
-        if ws[f'D{id_cells[video_clips.index(clip)].row}'].value:
-            sub_txt += str(ws[f'D{id_cells[video_clips.index(clip)].row}'].value)
-        if ws[f'E{id_cells[video_clips.index(clip)].row}'].value:
-            sub_txt += '\n' + str(ws[f'E{id_cells[video_clips.index(clip)].row}'].value)
-        if ws[f'F{id_cells[video_clips.index(clip)].row}'].value:
-            sub_txt += '\n' + str(ws[f'F{id_cells[video_clips.index(clip)].row}'].value)
-        
-        start_time = int(sum(previous_clip.duration - custom_padding for previous_clip in video_clips[:video_clips.index(clip)])) + custom_padding
-        end_time = int(sum(previous_clip.duration - custom_padding for previous_clip in video_clips[:video_clips.index(clip)+1]))
+        start_sub_idx = len(subtitles)
 
-        subs.append(((start_time, end_time), sub_txt))
+    generator = partial(render_text,
+                        font=sub_font_file, 
+                        font_size=scale_size(sub_font_size, scale), 
+                        color=sub_text_color, 
+                        stroke_color=sub_stroke_color, 
+                        stroke_width=scale_size(sub_stroke_width, scale), 
+                        margin=(scale_size(10, scale), scale_size(20, scale)),
+                        cache=text_cache)
+    subs = [(windows[i], rows[i]['subtitle']) for i in range(start_clip_idx, len(durations))]
 
     if subs:
-        subtitles.append(SubtitlesClip(subs, make_textclip=generator, encoding='utf-8'))
+        subtitles.append(subtitle_track(subs, generator))
 
     return subtitles, start_sub_idx
 
+def scale_size(size, scale):
+    # Sizes that are not zero are kept at one pixel or more so that thin outlines do not disappear.
+    return size if scale == 1 else max(1, round(size * scale)) if size else size
+
+def render_segmented(recap, durations, output_file, custom_padding, render_workers, worker_args, clip_descriptors=None):
+    # Encode each clip body and each crossfade as a separate segment in parallel worker processes,
+    # render the audio track once, then join everything without re-encoding the video.
+    # If clip_descriptors are given, segments are kept next to the output file along with a manifest of their hashes,
+    # and segments whose hash is unchanged since the previous run are reused rather than rendered again.
+    fps = recap.fps
+    segments = plan_segments(durations, custom_padding, recap.duration, fps)
+    render_options = worker_args[-1]
+
+    if clip_descriptors is not None:
+        segment_dir = f'{output_file}.segments'
+        os.makedirs(segment_dir, exist_ok=True)
+        # Font and image files are identified by their fingerprints so that replacing one triggers a re-render.
+        option_fingerprints = {name: file_fingerprint(value) if name.endswith('_file') and os.path.isfile(value) else value
+                               for name, value in render_options.items()}
+        hashes = segment_hashes(segments, clip_descriptors, durations, custom_padding, fps, render_options['include_intro'], option_fingerprints)
+        segment_files = [str(Path(segment_dir, f'{segment_hash}.mp4')) for segment_hash in hashes]
+    else:
+        segment_dir = tempfile.mkdtemp(prefix='recap_segments_', dir=Path(output_file).resolve().parent)
+        segment_files = [str(Path(segment_dir, f'{n:04d}_{segment.kind}_{segment.index}.mp4')) for n, segment in enumerate(segments)]
+
+    manifest_file = f'{output_file}.manifest.json'
+    pending = list(range(len(segments)))
+    if clip_descriptors is not None:
+        # Only segments recorded in the manifest of the previous run are reused.
+        previous = read_manifest(manifest_file)
+        reusable = {entry['hash'] for entry in previous['segments']} if previous else set()
+        pending = [n for n in pending if not (hashes[n] in reusable and os.path.exists(segment_files[n]))]
+    if len(pending) < len(segments):
+        print(f'Reusing {len(segments) - len(pending)} of {len(segments)} previously rendered segments.')
+    audio_dir = tempfile.mkdtemp(prefix='recap_audio_', dir=Path(output_file).resolve().parent)
+
+    try:
+        futures = []
+        executor = None
+        if pending:
+            workers = min(render_workers or os.cpu_count() or 1, len(pending))
+            print(f'Rendering {len(pending)} segments using {workers} worker processes...')
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                           initializer=init_segment_worker, initargs=worker_args)
+            # Clip bodies are submitted first as they take the longest. The short crossfades follow.
+            order = sorted(pending, key=lambda n: segments[n].kind != 'body')
+            futures = [executor.submit(render_segment, segment_files[n], segments[n].start_frame, segments[n].n_frames, fps) for n in order]
+
+        rendered = False
+        try:
+            audio_file = None
+            if recap.audio is not None:
+                audio_file = str(Path(audio_dir, 'audio.wav'))
+                recap.audio.write_audiofile(audio_file, fps=44100, codec='pcm_s16le')
+
+            for future in futures:
+                future.result()
+            rendered = True
+        finally:
+            if executor:
+                # If anything failed, the segments that have not started yet are cancelled so that the error is raised
+                # as soon as the segments already being rendered finish.
+                executor.shutdown(cancel_futures=not rendered)
+
+        print('Joining segments...')
+        concat_segments(segment_files, audio_file, output_file)
+    finally:
+        shutil.rmtree(audio_dir, ignore_errors=True)
+        if clip_descriptors is None:
+            shutil.rmtree(segment_dir, ignore_errors=True)
+
+    if clip_descriptors is not None:
+        write_manifest(manifest_file, fps, segments, hashes, segment_files)
+        # Remove segments that are no longer part of the recap.
+        for segment_file in set(Path(segment_dir).iterdir()) - {Path(f) for f in segment_files}:
+            segment_file.unlink(missing_ok=True)
+
+# The recap built by each segment rendering worker process.
+_segment_recap = None
+
+def init_segment_worker(rows, clip_ranges, video_directory, custom_padding, text_cache, max_open_readers, render_options):
+    # Rebuild the recap in the worker process. Audio is rendered by the main process, so it is not normalised here.
+    global _segment_recap
+    video_clips = extract_clips([str(Path(video_directory, f"{row['id']}")) for row in rows], clip_ranges, verbose=False,
+                                reader_pool=ReaderPool(max_open_readers) if max_open_readers else None)
+    _segment_recap, _ = build_recap(rows, video_clips, custom_padding, text_cache, verbose=False, **render_options)
+
+def render_segment(segment_file, start_frame, n_frames, fps):
+    from moviepy import VideoClip
+    start = start_frame / fps
+    # The extra half frame guards against the frame count being rounded down.
+    segment = VideoClip(frame_function=lambda t: _segment_recap.get_frame(start + t), duration=(n_frames + 0.5) / fps)
+    # Write to a temporary name first so that an interrupted render never leaves a partial segment to be reused.
+    part_file = f'{segment_file[:-len(".mp4")]}.part.mp4'
+    segment.write_videofile(part_file, fps=fps, audio=False, logger=None)
+    os.replace(part_file, segment_file)
+
+def plan_recap(options):
+    # Check every row of the spreadsheet and print the timeline of the recap, using only the metadata of the videos.
+    # Nothing is analysed or rendered. Returns True if no problems were found.
+    rows = [dict(row, file=str(Path(options['video_directory'], f"{row['id']}")))
+            for row in read_video_data(options['video_data_file'], options['worksheet'])]
+
+    print(f'Probing {len(set(row["file"] for row in rows))} videos...')
+    media = probe_all([row['file'] for row in rows])
+    durations, problems, notes = check_rows(rows, media, options['clip_selection_method'], options['clip_length'], CUSTOM_PADDING)
+    problems += check_files(options)
+    if not rows:
+        problems.append(f"No videos are listed in {options['video_data_file']}.")
+    if rows and options['use_overlay_intro_image'] and options['intro_image_duration'] > durations[0]:
+        notes.append(f"The intro image is shown for {options['intro_image_duration']}s, so the background will be shown behind it after the {durations[0]:g}s intro clip ends.")
+        # The renderer extends the intro clip to last as long as the intro image (see letterbox()).
+        durations[0] = options['intro_image_duration']
+
+    if rows:
+        print(f'\nTimeline of {output_description(options)} ({len(rows)} clips, {format_time(sum(durations) - CUSTOM_PADDING * (len(durations) - 1))} long):')
+        print(f"{'#':>4}  {'Clip':<17}  {'Crossfade in':<17}  {'Subtitle':<17}  Source")
+        for n, (row, entry) in enumerate(zip(rows, timeline(durations, CUSTOM_PADDING, options['include_intro'])), start=1):
+            info = media[row['file']]
+            crossfade = ' - '.join(map(format_time, entry['crossfade'])) if entry['crossfade'] else '-'
+            subtitle = ' - '.join(map(format_time, entry['subtitle'])) if row['subtitle'] else '-'
+            if row['start'] and row['end'] or options['clip_selection_method'] == 'manual':
+                source_range = f"{row['start']} to {row['end']}"
+            else:
+                source_range = 'chorus'
+            details = '' if 'error' in info else f" ({info['width']}x{info['height']}, {format_time(info['duration'] or 0)}{'' if info['has_audio'] else ', no audio'})"
+            print(f"{n:>4}  {' - '.join(map(format_time, entry['clip'])):<17}  {crossfade:<17}  {subtitle:<17}  {row['id']} {source_range}{details}")
+
+    for note in notes:
+        print(f'Note: {note}')
+    for problem in problems:
+        print(f'Problem: {problem}')
+    print(f'\n{len(problems)} problems found.' if problems else '\nNo problems found. The recap is ready to render.')
+    return not problems
+
+def output_description(options):
+    if options['render_mode'] == 'draft':
+        return draft_output_file(options['output_file'])
+    return options['output_file']
+
 def read_yaml(finput):
     yaml_schema = load_yaml(fschema) if isinstance(fschema, str) else fschema
     myobj = load_yaml(finput) if isinstance(finput, str) else finput
@@ -285,7 +635,33 @@ def extend_with_default(validator_class):
 
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description='Extracts clips from video files and combines them into a single recap video.')
+    parser.add_argument('--cache-info', action='store_true', help='Print the contents of the caches and exit.')
+    parser.add_argument('--clear-cache', action='store_true', help='Delete all cached results and exit.')
+    parser.add_argument('--plan', action='store_true', help='Check the spreadsheet and videos and print the timeline of the recap without rendering it.')
+    parser.add_argument('--batch', metavar='JOBS_FILE', help='Render every recap listed in a batch file, then exit.')
+    parser.add_argument('--batch-workers', type=int, help='The number of recaps rendered at once in batch mode. Overrides the batch file. 0 means one per CPU core.')
+    args = parser.parse_args()
+
+    if args.batch:
+        from batch import run_batch
+        summary = run_batch(args.batch, args.batch_workers)
+        sys.exit(0 if all(job['status'] == 'ok' for job in summary['jobs']) else 1)
+
     options = read_yaml('options.yaml')
+    if args.plan:
+        sys.exit(0 if plan_recap(options) else 1)
+    if args.cache_info or args.clear_cache:
+        for cache in open_caches(options['cache_directory'], options['cache_max_size_mb'], options['proxy_cache_max_size_mb'],
+                                 options['text_cache_max_size_mb']).values():
+            if args.clear_cache:
+                cache.clear()
+                print(f'Cleared {cache.namespace} cache at {cache.path}')
+            if args.cache_info:
+                print_cache_info(cache)
+        sys.exit(0)
+
     try:
         generate_recap(**options)
     except NoBackendError:
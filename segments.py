@@ -0,0 +1,125 @@
+# segments.py - Splits a recap timeline into independently encoded segments and joins them with FFmpeg.
+#
+# Each clip body (the part of a clip that is not crossfading with its neighbours) becomes one segment, and each
+# custom_padding crossfade between two clips becomes another. Segment boundaries are aligned to output frames, so the
+# encoded segments can be concatenated without re-encoding and contain exactly the frames of a single-pass render.
+
+import json
+import os
+import subprocess
+from collections import namedtuple
+from recap_cache import DiskCache
+
+FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+
+# kind is 'body' or 'crossfade'. For a crossfade, index is the clip that is fading in.
+Segment = namedtuple('Segment', ['kind', 'index', 'start_frame', 'n_frames'])
+
+
+def to_seconds(time):
+    # Convert a number of seconds or an 'hh:mm:ss', 'mm:ss' or 'ss' string to seconds, as MoviePy does for subclipped.
+    if isinstance(time, str):
+        time = [float(part.replace(',', '.')) for part in time.split(':')]
+    if not isinstance(time, (tuple, list)):
+        return time
+    return sum(mult * part for mult, part in zip((1, 60, 3600), reversed(time)))
+
+def clip_offsets(durations, custom_padding):
+    # Start time of each clip in the recap, with consecutive clips overlapping by custom_padding seconds.
+    offsets = [0]
+    for duration in durations[:-1]:
+        offsets.append(offsets[-1] + duration - custom_padding)
+    return offsets
+
+def plan_segments(durations, custom_padding, total_duration, fps):
+    offsets = clip_offsets(durations, custom_padding)
+    spans = []
+    body_start = 0
+    for i in range(1, len(durations)):
+        spans.append(('body', i - 1, body_start, offsets[i]))
+        spans.append(('crossfade', i, offsets[i], offsets[i] + custom_padding))
+        body_start = offsets[i] + custom_padding
+    spans.append(('body', len(durations) - 1, body_start, total_duration))
+
+    # Convert to whole frames, keeping the segments contiguous and dropping any that end up empty.
+    segments = []
+    last_frame = 0
+    total_frames = int(total_duration * fps)
+    for kind, index, _, end in spans:
+        end_frame = min(max(round(end * fps), last_frame), total_frames)
+        if end_frame > last_frame:
+            segments.append(Segment(kind, index, last_frame, end_frame - last_frame))
+        last_frame = end_frame
+    if last_frame < total_frames:
+        kind, index, start_frame, n_frames = segments[-1]
+        segments[-1] = Segment(kind, index, start_frame, n_frames + total_frames - last_frame)
+    return segments
+
+def subtitle_windows(durations, custom_padding, include_intro=False):
+    # The (start, end) time of the subtitle shown over each clip, truncated to whole seconds as in generate_subtitles.
+    windows = []
+    elapsed = 0
+    for i, duration in enumerate(durations):
+        if i == 0 and include_intro:
+            windows.append((custom_padding, int(duration - custom_padding)))
+        else:
+            windows.append((int(elapsed) + custom_padding, int(elapsed + (duration - custom_padding))))
+        elapsed += duration - custom_padding
+    return windows
+
+def segment_hashes(segments, clip_descriptors, durations, custom_padding, fps, include_intro, render_options):
+    # Hash everything that determines the frames of each segment: the clips visible in it (their source, time range
+    # and subtitle text), where the segment falls within each of those clips, whether a clip is faded in or out at the
+    # start or end of the recap, the subtitle windows overlapping it and the resize, font and intro options.
+    offsets = clip_offsets(durations, custom_padding)
+    windows = subtitle_windows(durations, custom_padding, include_intro)
+    hashes = []
+    for segment in segments:
+        start = segment.start_frame / fps
+        end = (segment.start_frame + segment.n_frames) / fps
+        clips = [{'clip': clip_descriptors[i],
+                  'first': i == 0,
+                  'last': i == len(durations) - 1,
+                  'offset': round(start - offsets[i], 6),
+                  'subtitle_window': [round(t - start, 6) for t in windows[i]] if windows[i][0] < end and windows[i][1] > start else None}
+                 for i in range(len(durations)) if offsets[i] < end and offsets[i] + durations[i] > start]
+        hashes.append(DiskCache.make_key(segment.n_frames, fps, custom_padding, clips, render_options))
+    return hashes
+
+def read_manifest(manifest_file):
+    try:
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def write_manifest(manifest_file, fps, segments, hashes, segment_files):
+    manifest = {'fps': fps,
+                'segments': [{'kind': segment.kind,
+                              'index': segment.index,
+                              'start_frame': segment.start_frame,
+                              'n_frames': segment.n_frames,
+                              'hash': segment_hash,
+                              'file': os.path.basename(segment_file)}
+                             for segment, segment_hash, segment_file in zip(segments, hashes, segment_files)]}
+    tmp_file = f'{manifest_file}.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_file, manifest_file)
+
+def concat_segments(segment_files, audio_file, output_file):
+    # Join the encoded segments without re-encoding them, muxing in the separately rendered audio track.
+    list_file = f'{output_file}.segments.txt'
+    with open(list_file, 'w', encoding='utf-8') as f:
+        for segment_file in segment_files:
+            escaped = os.path.abspath(segment_file).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    cmd = [FFMPEG_BINARY, '-nostdin', '-y', '-v', 'error', '-f', 'concat', '-safe', '0', '-i', list_file]
+    if audio_file:
+        cmd += ['-i', audio_file, '-map', '0:v', '-map', '1:a', '-c:a', 'aac']
+    cmd += ['-c:v', 'copy', output_file]
+    try:
+        subprocess.run(cmd, check=True)
+    finally:
+        os.remove(list_file)
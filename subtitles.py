@@ -0,0 +1,91 @@
+# subtitles.py - Subtitle tracks built from cached text rasters.
+#
+# Each unique combination of text and style (font, size, colours and stroke) is rendered with TextClip exactly once
+# into an RGB sprite plus alpha mask. Sprites are shared between all the clips of a recap and, through the on-disk
+# cache, between runs. Alphas are kept as 8-bit masks, both on disk, where the mostly transparent sprites compress well,
+# and in memory, where they are only scaled to 0-1 for the frame being composited. A subtitle track finds the subtitle shown at time t with a binary search over its start times.
+
+import importlib.metadata
+import os
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+import numpy as np
+from recap_cache import DiskCache, file_fingerprint
+
+# Sprites rendered or loaded during this process, keyed by the same key as the on-disk cache. Batch mode renders many
+# recaps in one process, so the least recently used sprites are dropped beyond _MAX_SPRITE_BYTES.
+_sprites = OrderedDict()
+_sprites_lock = threading.Lock()
+_sprite_bytes = 0
+_MAX_SPRITE_BYTES = 64 * 1024 * 1024
+
+# What SubtitlesClip shows when there is no subtitle: a single transparent pixel.
+_BLANK_RGB = np.zeros((1, 1, 3), dtype=np.uint8)
+_BLANK_ALPHA = np.zeros((1, 1))
+
+
+def render_text(text, font, font_size, color, stroke_color, stroke_width, margin=(None, None), cache=None):
+    # Return the (rgb, alpha) sprite for text in the given style, rendering it only if it has not been seen before.
+    font_id = file_fingerprint(font) if os.path.isfile(font) else font
+    key = DiskCache.make_key(text, font_id, font_size, color, stroke_color, stroke_width, margin, _moviepy_version(), 'alpha:uint8')
+    with _sprites_lock:
+        if key in _sprites:
+            _sprites.move_to_end(key)
+            return _sprites[key]
+
+    arrays = cache.get_arrays(key) if cache else None
+    if arrays is None:
+        from moviepy import TextClip
+        text_clip = TextClip(text=text, font=font, font_size=font_size, color=color,
+                             stroke_color=stroke_color, stroke_width=stroke_width, margin=margin)
+        alpha = np.round(np.clip(text_clip.mask.get_frame(0), 0, 1) * 255).astype(np.uint8)
+        arrays = {'rgb': text_clip.get_frame(0).astype(np.uint8), 'alpha': alpha}
+        if cache:
+            cache.put_arrays(key, **arrays)
+
+    # Sprites just rendered use the stored 8-bit alpha too, so a recap looks the same whether or not they were cached.
+    global _sprite_bytes
+    sprite = (arrays['rgb'], arrays['alpha'])
+    with _sprites_lock:
+        if key not in _sprites:
+            _sprites[key] = sprite
+            _sprite_bytes += _sprite_size(sprite)
+        while _sprite_bytes > _MAX_SPRITE_BYTES and len(_sprites) > 1:
+            _sprite_bytes -= _sprite_size(_sprites.popitem(last=False)[1])
+    return sprite
+
+def _sprite_size(sprite):
+    return sprite[0].nbytes + sprite[1].nbytes
+
+def subtitle_track(subtitles, make_sprite):
+    # Build a clip showing each ((start, end), text) subtitle over its time window. Subtitles must not overlap.
+    # make_sprite(text) returns the (rgb, alpha) sprite for a subtitle, with alpha as a uint8 mask. Empty subtitles are
+    # not shown.
+    from moviepy import VideoClip
+    entries = sorted(((start, end, make_sprite(text)) for (start, end), text in subtitles if text), key=lambda entry: entry[0])
+    starts = [start for start, _, _ in entries]
+
+    def current_sprite(t):
+        i = bisect_right(starts, t) - 1
+        if i >= 0 and t < entries[i][1]:
+            return entries[i][2]
+        return None
+
+    def frame_function(t):
+        sprite = current_sprite(t)
+        return sprite[0] if sprite is not None else _BLANK_RGB
+
+    def mask_function(t):
+        sprite = current_sprite(t)
+        return sprite[1] / 255 if sprite is not None else _BLANK_ALPHA
+
+    duration = max((end for (_, end), _ in subtitles), default=0)
+    mask = VideoClip(frame_function=mask_function, is_mask=True, duration=duration, has_constant_size=False)
+    return VideoClip(frame_function=frame_function, duration=duration, has_constant_size=False).with_mask(mask)
+
+def _moviepy_version():
+    try:
+        return importlib.metadata.version('moviepy')
+    except importlib.metadata.PackageNotFoundError:
+        return None
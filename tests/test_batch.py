@@ -0,0 +1,83 @@
+# test_batch.py - Checks that batch jobs are validated before any recap is rendered.
+#
+# Only the options are loaded, so no media or FFmpeg is needed.
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# batch imports the generator, which needs these at import time.
+for module in ('jsonschema', 'ruamel.yaml', 'audioread', 'numpy', 'openpyxl'):
+    pytest.importorskip(module)
+
+from batch import load_jobs
+
+
+@pytest.fixture
+def options_file(tmp_path, monkeypatch):
+    # Relative output files are resolved against the working directory, as when running the generator.
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / 'options.yaml'
+    path.write_text('video_data_file: video_data.xlsx\noutput_file: recap.mp4\nclip_length: 20\n', encoding='utf-8')
+    return str(path)
+
+def errors(jobs):
+    return [job.get('error') for job in jobs]
+
+def test_options_are_validated_and_overridden(options_file):
+    jobs = load_jobs({'options': options_file,
+                      'jobs': [{'name': 'first', 'output_file': 'first.mp4'},
+                               {'output_file': 'second.mp4', 'clip_length': 10}]})
+    assert errors(jobs) == [None, None]
+    assert [job['name'] for job in jobs] == ['first', 'job 2']
+    assert [job['options']['clip_length'] for job in jobs] == [20, 10]
+    # Options not set in either place get their defaults.
+    assert jobs[0]['options']['render_mode'] == 'standard'
+
+def test_job_given_as_options_file(options_file):
+    jobs = load_jobs({'jobs': [options_file]})
+    assert errors(jobs) == [None]
+    assert jobs[0]['options_file'] == options_file
+    assert jobs[0]['options']['output_file'] == 'recap.mp4'
+
+@pytest.mark.parametrize('job, error', [
+    ({'output_file': 'a.mp4', 'bogus': 1}, 'ValueError: Unknown options: bogus'),
+    ({'output_file': 'a.mp4', 'options': 'missing.yaml'}, 'FileNotFoundError: Options file missing.yaml not found'),
+    ({'output_file': 'a.mp4', 'render_mode': 'fast'}, 'ValidationError'),
+    ({'output_file': 'a.mp4', 'clip_length': 'long'}, 'ValidationError'),
+])
+def test_invalid_job(options_file, job, error):
+    jobs = load_jobs({'options': options_file, 'jobs': [job, {'output_file': 'b.mp4'}]})
+    assert error in jobs[0]['error'] and 'options' not in jobs[0]
+    # The other jobs are still run.
+    assert errors(jobs)[1] is None
+
+@pytest.mark.parametrize('jobs, clash', [
+    # Jobs that would write the same output file, however it is spelt.
+    ([{'name': 'a'}, {'name': 'b'}], 'recap.mp4 is also written by a'),
+    ([{'name': 'a', 'output_file': 'out.mp4'}, {'name': 'b', 'output_file': './out.mp4'}], './out.mp4 is also written by a'),
+    ([{'name': 'a', 'output_file': 'one.mp4', 'profile_report': 'profile.json'},
+      {'name': 'b', 'output_file': 'two.mp4', 'profile_report': 'profile.json'}], 'profile.json is also written by a'),
+    # A draft is written next to the output file with .draft added to its name, so it does not clash with a full render.
+    ([{'name': 'a'}, {'name': 'b', 'render_mode': 'draft'}], None),
+    ([{'name': 'a', 'render_mode': 'draft'}, {'name': 'b', 'output_file': 'recap.draft.mp4'}], 'recap.draft.mp4 is also written by a'),
+])
+def test_duplicate_outputs(options_file, jobs, clash):
+    loaded = load_jobs({'options': options_file, 'jobs': jobs})
+    assert loaded[0].get('error') is None
+    if clash is None:
+        assert loaded[1].get('error') is None
+    else:
+        assert loaded[1]['error'] == clash and 'options' not in loaded[1]
+
+def test_duplicate_of_invalid_job_is_allowed(options_file):
+    # An invalid job is never run, so it does not claim its output file.
+    jobs = load_jobs({'options': options_file, 'jobs': [{'bogus': 1}, {}]})
+    assert jobs[0]['error'] and jobs[1].get('error') is None
+
+def test_no_jobs():
+    assert load_jobs({}) == []
+    assert load_jobs({'jobs': None}) == []
@@ -0,0 +1,84 @@
+# test_frame_pipeline.py - Checks that frames rendered ahead by pipelined() are identical to sequentially rendered ones.
+#
+# Needs MoviePy and FFmpeg, and is skipped without them. The recap is built from letterboxed, crossfading clips of
+# videos with different aspect ratios, so that every source gets a decoding thread and frames overlap two sources.
+
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+moviepy = pytest.importorskip('moviepy')
+np = pytest.importorskip('numpy')
+if shutil.which('ffmpeg') is None:
+    pytest.skip('FFmpeg is not installed', allow_module_level=True)
+
+import moviepy.video.fx as vfx
+from frame_pipeline import pipelined
+from letterbox import letterbox
+from segments import clip_offsets
+from timeline import TimelineClip
+
+FRAME_SIZES = ['64x36', '36x64', '48x36', '96x32']
+VIDEO_DURATION = 4
+CLIP_RANGE = (1, 3.5)
+CANVAS_SIZE = (160, 90)
+PADDING = 1
+FPS = 10
+
+
+@pytest.fixture(scope='module')
+def video_files(tmp_path_factory):
+    # Short moving test pattern videos in several frame sizes.
+    video_dir = tmp_path_factory.mktemp('videos')
+    files = []
+    for i, size in enumerate(FRAME_SIZES):
+        files.append(str(video_dir / f'video_{i}.mp4'))
+        cmd = ['ffmpeg', '-nostdin', '-y', '-v', 'error',
+               '-f', 'lavfi', '-i', f'testsrc2=size={size}:rate=25:duration={VIDEO_DURATION}',
+               '-c:v', 'libx264', '-pix_fmt', 'yuv420p', files[-1]]
+        subprocess.run(cmd, check=True)
+    return files
+
+def build_recap(video_files):
+    # Fresh clips each time, so that the readers of every render start from the same state.
+    clips = [letterbox(moviepy.VideoFileClip(video_file, audio=False).subclipped(*CLIP_RANGE), str(ROOT / '1920x1080-black.jpg'), CANVAS_SIZE)
+             for video_file in video_files]
+    offsets = clip_offsets([clip.duration for clip in clips], PADDING)
+    faded = [clips[0]] + [clip.with_start(offset).with_effects([vfx.CrossFadeIn(PADDING)]) for clip, offset in zip(clips[1:], offsets[1:])]
+    return TimelineClip(faded), clips
+
+def render_frames(recap):
+    return [recap.get_frame(i / FPS) for i in range(int(recap.duration * FPS))]
+
+@pytest.mark.parametrize('workers, frame_queue_size', [(2, 1), (4, 4), (4, 16)])
+def test_pipelined_frames_match(video_files, workers, frame_queue_size):
+    recap, clips = build_recap(video_files)
+    expected = render_frames(recap)
+    for clip in clips:
+        clip.close()
+
+    recap, clips = build_recap(video_files)
+    with pipelined(recap, FPS, workers, frame_queue_size):
+        frames = render_frames(recap)
+    for clip in clips:
+        clip.close()
+
+    assert len(frames) == len(expected)
+    for i, (frame, expected_frame) in enumerate(zip(frames, expected)):
+        assert np.array_equal(frame, expected_frame), f'frame {i} differs'
+
+def test_pipelined_restores_frame_functions(video_files):
+    recap, clips = build_recap(video_files)
+    frame_function = recap.frame_function
+    with pipelined(recap, FPS, 2):
+        recap.get_frame(0)
+    assert recap.frame_function == frame_function
+    assert all('get_frame' not in vars(clip.letterbox_source) for clip in clips)
+    for clip in clips:
+        clip.close()
@@ -0,0 +1,71 @@
+# test_planning.py - Checks the row validation and timeline of --plan against probed media metadata.
+#
+# The media metadata is given directly rather than probed, so no media or FFprobe is needed.
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from planning import check_rows, format_time, timeline
+
+CLIP_LENGTH = 15
+PADDING = 1
+
+MEDIA = {'full.mp4': {'has_video': True, 'has_audio': True, 'duration': 60.0},
+         'silent.mp4': {'has_video': True, 'has_audio': False, 'duration': 60.0},
+         'short.mp4': {'has_video': True, 'has_audio': True, 'duration': 10.0},
+         'audio.mp3': {'has_video': False, 'has_audio': True, 'duration': 60.0},
+         'missing.mp4': {'error': 'file not found'}}
+
+
+def row(file, start=None, end=None):
+    return {'row': 2, 'id': file, 'file': file, 'start': start, 'end': end}
+
+@pytest.mark.parametrize('method, video_row, duration, problem, note', [
+    # Rows left to chorus detection are assumed to last clip_length seconds.
+    ('auto', row('full.mp4'), CLIP_LENGTH, None, None),
+    ('auto', row('full.mp4', '0:10', '0:20'), 10, None, None),
+    ('auto', row('full.mp4', '10'), CLIP_LENGTH, None, 'only one of the clip start and end times is set'),
+    ('auto', row('silent.mp4'), CLIP_LENGTH, 'no audio stream for chorus detection', None),
+    ('auto', row('silent.mp4', '10', '20'), 10, None, 'no audio stream'),
+    ('auto', row('short.mp4'), CLIP_LENGTH, 'shorter than clip_length', None),
+    ('auto', row('audio.mp3'), CLIP_LENGTH, 'no video stream', None),
+    ('auto', row('missing.mp4'), CLIP_LENGTH, 'file not found', None),
+    ('manual', row('full.mp4', '5', '12.5'), 7.5, None, None),
+    ('manual', row('full.mp4'), CLIP_LENGTH, 'are required when clip_selection_method is manual', None),
+    ('manual', row('full.mp4', 'ten', '20'), CLIP_LENGTH, 'invalid clip times', None),
+    ('manual', row('full.mp4', '20', '10'), 0, 'must be after its start', None),
+    ('manual', row('full.mp4', '50', '1:10'), 20, 'the video is only 60.0s long', None),
+    ('manual', row('full.mp4', '10', '11.5'), 1.5, 'shorter than its crossfades', None),
+])
+def test_check_rows(method, video_row, duration, problem, note):
+    durations, problems, notes = check_rows([video_row], MEDIA, method, CLIP_LENGTH, PADDING)
+    assert durations == [duration]
+    if problem is None:
+        assert problems == []
+    else:
+        assert len(problems) == 1 and problem in problems[0] and problems[0].startswith(f"Row 2 ({video_row['id']})")
+    if note is None:
+        assert notes == []
+    else:
+        assert len(notes) == 1 and note in notes[0]
+
+def test_check_rows_reports_every_row():
+    rows = [row('full.mp4'), row('missing.mp4'), row('full.mp4', '0', '1')]
+    durations, problems, _ = check_rows(rows, MEDIA, 'auto', CLIP_LENGTH, PADDING)
+    assert durations == [CLIP_LENGTH, CLIP_LENGTH, 1]
+    assert len(problems) == 2
+
+def test_timeline():
+    assert timeline([5, 6, 4], PADDING, False) == [
+        {'clip': (0, 5), 'crossfade': None, 'subtitle': (1, 4)},
+        {'clip': (4, 10), 'crossfade': (4, 5), 'subtitle': (5, 9)},
+        {'clip': (9, 13), 'crossfade': (9, 10), 'subtitle': (10, 12)},
+    ]
+
+@pytest.mark.parametrize('seconds, text', [(0, '0:00.0'), (65.25, '1:05.2'), (-3, '-0:03.0'), (600, '10:00.0')])
+def test_format_time(seconds, text):
+    assert format_time(seconds) == text
@@ -0,0 +1,90 @@
+# test_reader_pool.py - Checks that clips read through a ReaderPool give the same audio as clips that keep their readers,
+# and that their memory use stays flat however many clips are registered.
+#
+# Needs MoviePy and FFmpeg, and is skipped without them. The clips start well into their videos, beyond the audio
+# buffered when each clip is opened, so reopened audio readers have to seek forward.
+
+import shutil
+import subprocess
+import sys
+import tracemalloc
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+moviepy = pytest.importorskip('moviepy')
+np = pytest.importorskip('numpy')
+if shutil.which('ffmpeg') is None:
+    pytest.skip('FFmpeg is not installed', allow_module_level=True)
+
+from reader_pool import ReaderPool
+
+N_CLIPS = 6
+N_MANY_CLIPS = 24
+VIDEO_DURATION = 16
+CLIP_RANGE = (10, 13)
+
+
+@pytest.fixture(scope='module')
+def video_files(tmp_path_factory):
+    # Short test pattern videos with a different tone in each.
+    video_dir = tmp_path_factory.mktemp('videos')
+    files = []
+    for i in range(N_CLIPS):
+        files.append(str(video_dir / f'video_{i}.mp4'))
+        cmd = ['ffmpeg', '-nostdin', '-y', '-v', 'error',
+               '-f', 'lavfi', '-i', f'testsrc2=size=64x36:rate=10:duration={VIDEO_DURATION}',
+               '-f', 'lavfi', '-i', f'sine=frequency={220 * (i + 1)}:duration={VIDEO_DURATION}',
+               '-c:v', 'libx264', '-c:a', 'aac', '-shortest', files[-1]]
+        subprocess.run(cmd, check=True)
+    return files
+
+def recap_audio(video_files, max_open):
+    # The audio of the clips one after another, as a sound array.
+    pool = ReaderPool(max_open) if max_open else None
+    clips = []
+    for video_file in video_files:
+        clip = moviepy.VideoFileClip(video_file)
+        if pool:
+            pool.register(clip)
+        clips.append(clip.subclipped(*CLIP_RANGE))
+    try:
+        return moviepy.concatenate_audioclips([clip.audio for clip in clips]).to_soundarray(fps=44100)
+    finally:
+        if pool:
+            pool.close_all()
+
+@pytest.mark.parametrize('max_open', [1, 4])
+def test_pooled_audio_matches(video_files, max_open):
+    # More clips than max_open, so that audio readers are closed and reopened.
+    assert np.array_equal(recap_audio(video_files, max_open), recap_audio(video_files, 0))
+
+def test_audio_written_with_more_clips_than_readers(video_files, tmp_path):
+    pool = ReaderPool(2)
+    clips = [pool.register(moviepy.VideoFileClip(video_file)).subclipped(*CLIP_RANGE) for video_file in video_files]
+    audio_file = tmp_path / 'audio.wav'
+    moviepy.concatenate_audioclips([clip.audio for clip in clips]).write_audiofile(str(audio_file), logger=None)
+    assert audio_file.stat().st_size > 0
+    assert pool.open_count() <= 2
+
+def test_memory_flat_with_many_clips(video_files):
+    # Closed audio readers drop their decoded buffers, so each further clip adds far less than a buffer of memory.
+    pool = ReaderPool(2)
+    clips = []
+    usage = []
+    tracemalloc.start()
+    try:
+        for i in range(N_MANY_CLIPS):
+            clip = pool.register(moviepy.VideoFileClip(video_files[i % len(video_files)])).subclipped(*CLIP_RANGE)
+            clip.audio.to_soundarray(fps=44100)
+            clips.append(clip)
+            usage.append(tracemalloc.get_traced_memory()[0])
+    finally:
+        tracemalloc.stop()
+        pool.close_all()
+    buffer_bytes = clips[0].audio.reader.buffersize * clips[0].audio.reader.nchannels * 8
+    per_clip = (usage[-1] - usage[len(usage) // 2]) / (len(usage) - 1 - len(usage) // 2)
+    assert per_clip < buffer_bytes / 10
+    assert pool.open_count() == 0
@@ -0,0 +1,120 @@
+# test_segments.py - Checks the segment layout, subtitle windows and segment hashes of the segmented render mode.
+#
+# These are pure functions of the clip durations and options, so no media or FFmpeg is needed.
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from segments import Segment, clip_offsets, plan_segments, segment_hashes, subtitle_windows, to_seconds
+
+PADDING = 1
+FPS = 10
+
+
+def recap_duration(durations, custom_padding=PADDING):
+    return sum(durations) - custom_padding * (len(durations) - 1)
+
+@pytest.mark.parametrize('time, seconds', [
+    (12, 12),
+    (2.5, 2.5),
+    ('7', 7),
+    ('1:05', 65),
+    ('01:02:03', 3723),
+    ('0:10,5', 10.5),
+])
+def test_to_seconds(time, seconds):
+    assert to_seconds(time) == seconds
+
+@pytest.mark.parametrize('durations, offsets', [
+    ([5], [0]),
+    ([5, 5, 5], [0, 4, 8]),
+    ([3, 6, 2.5], [0, 2, 7]),
+])
+def test_clip_offsets(durations, offsets):
+    assert clip_offsets(durations, PADDING) == offsets
+
+@pytest.mark.parametrize('durations, segments', [
+    ([5], [Segment('body', 0, 0, 50)]),
+    ([5, 5, 5], [Segment('body', 0, 0, 40),
+                 Segment('crossfade', 1, 40, 10),
+                 Segment('body', 1, 50, 30),
+                 Segment('crossfade', 2, 80, 10),
+                 Segment('body', 2, 90, 40)]),
+    ([3, 6], [Segment('body', 0, 0, 20),
+              Segment('crossfade', 1, 20, 10),
+              Segment('body', 1, 30, 50)]),
+    # The middle clip is only as long as its two crossfades, so it has no body of its own.
+    ([5, 2, 5], [Segment('body', 0, 0, 40),
+                 Segment('crossfade', 1, 40, 10),
+                 Segment('crossfade', 2, 50, 10),
+                 Segment('body', 2, 60, 40)]),
+])
+def test_plan_segments(durations, segments):
+    assert plan_segments(durations, PADDING, recap_duration(durations), FPS) == segments
+
+@pytest.mark.parametrize('durations, fps', [
+    ([3.3, 2.7, 4.15], 24),
+    ([10.01, 7.5, 12.333, 6], 29.97),
+    ([5, 1.5, 5], 25),
+])
+def test_plan_segments_cover_every_frame(durations, fps):
+    # However the clip boundaries fall between frames, the segments are contiguous, non-empty and cover the recap.
+    total = recap_duration(durations)
+    segments = plan_segments(durations, PADDING, total, fps)
+    assert segments[0].start_frame == 0
+    for previous, segment in zip(segments, segments[1:]):
+        assert segment.start_frame == previous.start_frame + previous.n_frames
+    assert all(segment.n_frames > 0 for segment in segments)
+    assert segments[-1].start_frame + segments[-1].n_frames == int(total * fps)
+
+@pytest.mark.parametrize('durations, include_intro, windows', [
+    ([5], False, [(1, 4)]),
+    ([5, 5, 5], False, [(1, 4), (5, 8), (9, 12)]),
+    ([10.5, 5], False, [(1, 9), (10, 13)]),
+    ([7.5, 4], True, [(1, 6), (7, 9)]),
+    ([4.5, 6.5, 3], False, [(1, 3), (4, 9), (10, 11)]),
+])
+def test_subtitle_windows(durations, include_intro, windows):
+    assert subtitle_windows(durations, PADDING, include_intro) == windows
+
+def descriptors(n, **changes):
+    # Clip descriptors as generate_recap builds them, with changes given as {index: {key: value}}.
+    clips = [{'source': f'stat:video_{i}.mp4:1000:1', 'range': ['10', '15'], 'subtitle': f'Song {i}'} for i in range(n)]
+    for i, change in changes.items():
+        clips[int(i)].update(change)
+    return clips
+
+def hashes_of(clips, durations=(5, 5, 5), render_options=None):
+    durations = list(durations)
+    segments = plan_segments(durations, PADDING, recap_duration(durations), FPS)
+    return segments, segment_hashes(segments, clips, durations, PADDING, FPS, False, render_options or {'sub_font_size': 50})
+
+@pytest.mark.parametrize('change, changed_segments', [
+    # Editing the middle clip's subtitle re-renders that clip and both of its crossfades.
+    ({'1': {'subtitle': 'Another song'}}, {('crossfade', 1), ('body', 1), ('crossfade', 2)}),
+    # A new time range for the first clip re-renders it and the crossfade out of it.
+    ({'0': {'range': ['20', '25']}}, {('body', 0), ('crossfade', 1)}),
+    ({'2': {'source': 'stat:video_2.mp4:2000:2'}}, {('crossfade', 2), ('body', 2)}),
+    ({}, set()),
+])
+def test_segment_hashes_change_with_their_clips(change, changed_segments):
+    segments, before = hashes_of(descriptors(3))
+    _, after = hashes_of(descriptors(3, **change))
+    assert {(segment.kind, segment.index) for segment, old, new in zip(segments, before, after) if old != new} == changed_segments
+
+def test_segment_hashes_change_with_render_options():
+    _, before = hashes_of(descriptors(3))
+    _, after = hashes_of(descriptors(3), render_options={'sub_font_size': 60})
+    assert all(old != new for old, new in zip(before, after))
+
+def test_segment_hashes_change_when_a_clip_gets_longer():
+    # Lengthening the first clip moves every later clip, but their own frames are unchanged, so only the first clip
+    # and its crossfade are rendered again.
+    segments, before = hashes_of(descriptors(3))
+    _, after = hashes_of(descriptors(3, **{'0': {'range': ['10', '16']}}), durations=(6, 5, 5))
+    assert [old != new for old, new in zip(before, after)] == [True, True, False, False, False]
+    assert len(segments) == len(after)
@@ -0,0 +1,72 @@
+# test_video_data.py - Checks that the rows of the video data spreadsheet are read the same from XLSX and CSV files.
+
+import csv
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+openpyxl = pytest.importorskip('openpyxl')
+
+from video_data import parse_rows, read_video_data, subtitle_text
+
+HEADER = ('FILENAME', 'START', 'END', 'LINE 1', 'LINE 2', 'LINE 3')
+ROWS = [HEADER,
+        ('intro.mp4', None, None, 'Welcome', None, None),
+        ('song.mp4', '1:05', '1:20', 'Artist', 'Title', 'Album'),
+        (None, None, None, None, None, None),
+        ('gap.mp4', None, None, None, 'Second line only', None)]
+EXPECTED = [{'row': 2, 'id': 'intro.mp4', 'start': None, 'end': None, 'subtitle': 'Welcome'},
+            {'row': 3, 'id': 'song.mp4', 'start': '1:05', 'end': '1:20', 'subtitle': 'Artist\nTitle\nAlbum'},
+            {'row': 5, 'id': 'gap.mp4', 'start': None, 'end': None, 'subtitle': '\nSecond line only'}]
+
+
+@pytest.mark.parametrize('rows, expected', [
+    (ROWS, EXPECTED),
+    ([], []),
+    # Short rows are padded and cells beyond column F are ignored.
+    ([('a.mp4',), ('b.mp4', 3, 9, 'x', 'y', 'z', 'extra')],
+     [{'row': 1, 'id': 'a.mp4', 'start': None, 'end': None, 'subtitle': ''},
+      {'row': 2, 'id': 'b.mp4', 'start': 3, 'end': 9, 'subtitle': 'x\ny\nz'}]),
+    # Rows with an empty filename cell, as CSV files have, are skipped. Numeric filenames become strings.
+    ([('', '', '', '', '', ''), (123, None, None, None, None, None)],
+     [{'row': 2, 'id': '123', 'start': None, 'end': None, 'subtitle': ''}]),
+])
+def test_parse_rows(rows, expected):
+    assert parse_rows(rows) == expected
+
+@pytest.mark.parametrize('lines, text', [
+    ((None, None, None), ''),
+    (('One', None, None), 'One'),
+    (('One', None, 'Three'), 'One\nThree'),
+    ((1, 2, 3), '1\n2\n3'),
+])
+def test_subtitle_text(lines, text):
+    assert subtitle_text(lines) == text
+
+def test_read_xlsx(tmp_path):
+    wb = openpyxl.Workbook()
+    wb.active.title = 'Main'
+    for values in ROWS:
+        wb.active.append(values)
+    other = wb.create_sheet('Other')
+    other.append(HEADER)
+    other.append(('other.mp4', '0:10', '0:25', 'Elsewhere', None, None))
+    video_data_file = tmp_path / 'video_data.xlsx'
+    wb.save(video_data_file)
+
+    assert read_video_data(video_data_file) == EXPECTED
+    assert read_video_data(video_data_file, 'Other') == [
+        {'row': 2, 'id': 'other.mp4', 'start': '0:10', 'end': '0:25', 'subtitle': 'Elsewhere'}]
+    with pytest.raises(ValueError, match="No worksheet named 'Missing'"):
+        read_video_data(video_data_file, 'Missing')
+
+def test_read_csv(tmp_path):
+    # Saved with a byte order mark, as spreadsheet programs do. Empty CSV cells are read as empty strings.
+    video_data_file = tmp_path / 'video_data.csv'
+    with open(video_data_file, 'w', newline='', encoding='utf-8-sig') as f:
+        csv.writer(f).writerows([['' if cell is None else cell for cell in values] for values in ROWS])
+    expected = [{**row, 'start': row['start'] or '', 'end': row['end'] or ''} for row in EXPECTED]
+    assert read_video_data(video_data_file) == expected
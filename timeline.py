@@ -0,0 +1,42 @@
+# timeline.py - Compositing that only evaluates the layers playing at each frame.
+#
+# A plain CompositeVideoClip checks every one of its layers for every frame it renders, so the cost of each frame grows
+# with the number of clips in the recap. TimelineClip instead indexes its layers by time when it is built, so each frame
+# only looks at the few layers overlapping it (the current clip, the clip crossfading into it and its subtitles).
+
+from moviepy import CompositeVideoClip
+
+
+class TimelineClip(CompositeVideoClip):
+    # A CompositeVideoClip whose layers are looked up in an interval index of fixed-length time buckets.
+
+    def __init__(self, clips, bucket_duration=1.0, **kwargs):
+        super().__init__(clips, **kwargs)
+        self.bucket_duration = bucket_duration
+        # Clips of unbounded duration cannot be indexed, so they fall back to checking every layer.
+        self._buckets = build_interval_index(self.clips, self.duration, bucket_duration) if self.duration is not None else None
+
+        # The mask built by CompositeVideoClip has one layer per clip too, so it gets the same treatment.
+        if isinstance(self.mask, CompositeVideoClip) and not isinstance(self.mask, TimelineClip):
+            self.mask = TimelineClip(self.mask.clips, bucket_duration, size=self.mask.size, is_mask=True, bg_color=self.mask.bg_color)
+
+    def playing_clips(self, t=0):
+        if self._buckets is None:
+            return super().playing_clips(t)
+        bucket = int(t // self.bucket_duration)
+        if bucket < 0 or bucket >= len(self._buckets):
+            return []
+        return [clip for clip in self._buckets[bucket] if clip.is_playing(t)]
+
+
+def build_interval_index(clips, duration, bucket_duration):
+    # Assign each clip to every bucket its [start, end) interval overlaps, keeping the clips in layer order.
+    n_buckets = int(duration // bucket_duration) + 1
+    buckets = [[] for _ in range(n_buckets)]
+    for clip in clips:
+        end = clip.end if clip.end is not None else duration
+        first = max(0, int(clip.start // bucket_duration))
+        last = min(n_buckets - 1, int(end // bucket_duration))
+        for bucket in range(first, last + 1):
+            buckets[bucket].append(clip)
+    return buckets
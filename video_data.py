@@ -0,0 +1,50 @@
+# video_data.py - Reads the rows of the video data spreadsheet.
+#
+# The spreadsheet is read once, a row at a time, rather than looked up cell by cell. XLSX workbooks are opened in
+# openpyxl's read-only mode, which streams the rows from the file instead of loading every cell into memory first, so
+# even very long spreadsheets are read quickly. CSV files with the same columns are accepted too.
+
+import csv
+from pathlib import Path
+import openpyxl
+
+
+def read_video_data(video_data_file, worksheet=''):
+    # Return a dict for each row that names a video, with the spreadsheet 'row' number, the video 'id', the 'start' and
+    # 'end' cells of a manually chosen clip and the 'subtitle' text. worksheet is the name of the sheet of an XLSX
+    # workbook to read. The active sheet is read if it is empty.
+    if Path(video_data_file).suffix.lower() == '.csv':
+        # utf-8-sig skips the byte order mark that spreadsheet programs write at the start of CSV files.
+        with open(video_data_file, 'r', newline='', encoding='utf-8-sig') as f:
+            return parse_rows(csv.reader(f))
+
+    wb = openpyxl.load_workbook(video_data_file, read_only=True)
+    try:
+        if worksheet and worksheet not in wb.sheetnames:
+            raise ValueError(f"No worksheet named '{worksheet}' in {video_data_file}. Worksheets are: {', '.join(wb.sheetnames)}")
+        ws = wb[worksheet] if worksheet else wb.active
+        # Files saved by some programs record the size of the sheet wrongly, which would cut rows short.
+        ws.reset_dimensions()
+        return parse_rows(ws.iter_rows(values_only=True))
+    finally:
+        wb.close()
+
+def parse_rows(rows):
+    # Columns are A: filename, B: clip start, C: clip end, D to F: subtitle lines. Rows without a filename are skipped.
+    video_rows = []
+    for row_number, values in enumerate(rows, start=1):
+        cells = list(values)[:6] + [None] * (6 - len(values))
+        if cells[0] in ('FILENAME', None, ''):
+            continue
+        video_rows.append({'row': row_number, 'id': str(cells[0]), 'start': cells[1], 'end': cells[2], 'subtitle': subtitle_text(cells[3:6])})
+    return video_rows
+
+def subtitle_text(lines):
+    # Join the up to three lines of subtitle text in columns D to F.
+    sub_txt = ''
+    if lines[0]:
+        sub_txt += str(lines[0])
+    for line in lines[1:]:
+        if line:
+            sub_txt += '\n' + str(line)
+    return sub_txt